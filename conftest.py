@@ -0,0 +1 @@
+"""Lets pytest import the game package when run from the repository root."""
@@ -1,20 +1,58 @@
 import os
 import json
-import shutil
+import struct
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 
-# Read world.ldtk
-root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-path = os.path.join(root, 'world.ldtk')
-data = json.loads(open(path, 'r').read())
-grid_size = data["defaultGridSize"]
+# Packed binary level format, read by game.world_tools.load_level_data:
+#   prefix: magic, version, header length
+#   header: JSON of the level fields and entities, space padded to a multiple of 8 bytes
+#   layers: collision, colors and tile grids, one uint8 per cell in row major order
+LEVEL_MAGIC = b"CLVL"
+LEVEL_VERSION = 1
+LEVEL_PREFIX = struct.Struct("<4sII")
+LEVEL_HEADER_KEYS = ("id", "x", "y", "width", "height", "field_instances", "entities")
+
+# Bump when the exported data changes so every level is regenerated
+EXPORT_VERSION = 1
 
-# Create export folder
+root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 exportFolder = os.path.join(root, "data")
-os.makedirs(exportFolder, exist_ok=True)
+manifestPath = os.path.join(root, "export_manifest.json")   # Kept outside exportFolder, which the game loads every file from
+
+def write_atomic(path, content):
+    """Write content so readers only ever see the old or the new file."""
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+def write_level_binary(level_data, path):
+    width = level_data["width"]
+    tile_grid = bytearray(width * level_data["height"])
+    for tile in level_data["tiles"]:
+        tile_grid[tile["y"] * width + tile["x"]] = tile["t"]
 
-# Copy relevant data to separate JSON files
-for level in data['levels']:
-    f = open(os.path.join(exportFolder, level['identifier']+".json"), 'w')
+    header = json.dumps({key: level_data[key] for key in LEVEL_HEADER_KEYS}).encode()
+    padding = -(LEVEL_PREFIX.size + len(header)) % 8
+    write_atomic(path, b"".join((
+        LEVEL_PREFIX.pack(LEVEL_MAGIC, LEVEL_VERSION, len(header) + padding),
+        header + b" " * padding,
+        bytes(level_data["collision"]),
+        bytes(level_data["colors"]),
+        tile_grid,
+    )))
+
+def level_hash(level, grid_size):
+    """Hash of everything a level's output depends on."""
+    source = json.dumps([EXPORT_VERSION, grid_size, level], sort_keys=True).encode()
+    return hashlib.sha256(source).hexdigest()
+
+def level_outputs(id):
+    return [id+".json", id+".lvl"]
+
+def export_level(level, grid_size):
+    """Write the JSON and packed binary exports of one level. Returns the level identifier."""
     id = level['identifier']
     level_data = {}
     level_data["id"] = id
@@ -30,7 +68,7 @@ for level in data['levels']:
         fi["id"] = field["__identifier"]
         fi["value"] = field["__value"]
         level_data["field_instances"].append(fi)
-    
+
     level_data["tiles"] = []
     for tile in level["layerInstances"][2]["gridTiles"]:
         t = {}
@@ -38,7 +76,7 @@ for level in data['levels']:
         t["y"] = tile["px"][1] // grid_size
         t["t"] = tile["t"]
         level_data["tiles"].append(t)
-    
+
     level_data["entities"] = []
     for entity in level["layerInstances"][3]["entityInstances"]:
         e = {}
@@ -50,9 +88,61 @@ for level in data['levels']:
             fi = {}
             fi["id"] = field["__identifier"]
             fi["value"] = field["__value"]
-            field_instances.append(fi)        
-            
+            field_instances.append(fi)
+
         e["field_instances"] = field_instances
         level_data["entities"].append(e)
-        
-    json.dump(level_data, f)
\ No newline at end of file
+
+    json_name, lvl_name = level_outputs(id)
+    write_atomic(os.path.join(exportFolder, json_name), json.dumps(level_data).encode())
+    write_level_binary(level_data, os.path.join(exportFolder, lvl_name))
+    return id
+
+def load_manifest():
+    try:
+        with open(manifestPath, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"levels": {}}
+
+def main():
+    # Read world.ldtk
+    with open(os.path.join(root, 'world.ldtk'), 'r') as f:
+        data = json.load(f)
+    grid_size = data["defaultGridSize"]
+    os.makedirs(exportFolder, exist_ok=True)
+
+    # Find levels whose source changed or whose outputs are missing
+    previous = load_manifest()["levels"]
+    levels = {}
+    changed = []
+    for level in data['levels']:
+        id = level['identifier']
+        levels[id] = {"hash": level_hash(level, grid_size), "outputs": level_outputs(id)}
+        old = previous.get(id)
+        outputs_exist = all(os.path.exists(os.path.join(exportFolder, name)) for name in levels[id]["outputs"])
+        if old is None or old["hash"] != levels[id]["hash"] or not outputs_exist:
+            changed.append(level)
+
+    # Regenerate changed levels, in parallel when there's more than one
+    if len(changed) > 1:
+        with ProcessPoolExecutor() as executor:
+            regenerated = list(executor.map(export_level, changed, [grid_size] * len(changed)))
+    else:
+        regenerated = [export_level(level, grid_size) for level in changed]
+
+    # Remove the outputs of deleted levels
+    removed = [id for id in previous if id not in levels]
+    for id in removed:
+        for name in previous[id]["outputs"]:
+            try:
+                os.remove(os.path.join(exportFolder, name))
+            except FileNotFoundError:
+                pass
+
+    manifest = {"version": EXPORT_VERSION, "levels": levels, "regenerated": regenerated, "removed": removed}
+    write_atomic(manifestPath, json.dumps(manifest, indent=4).encode())
+    print(f"Exported {len(regenerated)} of {len(levels)} levels, removed {len(removed)}")
+
+if __name__ == "__main__":
+    main()
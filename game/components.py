@@ -1,5 +1,6 @@
 """Collection of common components."""
 from __future__ import annotations
+from collections.abc import Iterable
 from typing import Final, Self
 import attrs
 import tcod.ecs.callbacks
@@ -11,6 +12,14 @@ import game.world_tools
 from random import Random
 import math
 import libtcodpy
+import tcod.console
+import tcod.tileset
+from game.constants import COLOR_PALLETE_LUT
+from game.profiling import timed
+from game.occupancy import Occupancy
+from game.render_cache import RenderCache
+
+CHARMAP_CP437_LUT: Final = np.array(tcod.tileset.CHARMAP_CP437, dtype=np.int32)
 
 def clamp(value, min_value, max_value):
         return max(min(value, max_value), min_value)
@@ -30,40 +39,52 @@ class Position:
 class Enemy:
     """Test enemy component"""
     name: str
-    path: tcod.path.AStar
     noticed_player: bool = attrs.field(init=False)
     
-    def __init__(self, name: str, path: tcod.path.AStar):
+    def __init__(self, name: str):
         self.name = name
-        self.path = path
         self.noticed_player = False
     
+    @timed("enemy")
     def enemy_tick(self, player: Position, pos: Position, dungeon: game.world_tools.Dungeon):
         if not self.noticed_player:
-            visible = tcod.map.compute_fov(transparency=dungeon.map.transparent, pov=(pos.x, pos.y), algorithm=2)
-            if visible[player.x, player.y]: 
-                self.noticed_player = True
-                g.log.add_item(f"A {self.name} spotted you!")
-            return (pos.x, pos.y) # Wait single tick even if visible to allow player to react
+            return (pos.x, pos.y) # Wait until enemy_perception notices the player, then one more tick to allow player to react
         
         # Deal damage if within 1 space
         if abs(player.x - pos.x) <= 1 and abs(player.y - pos.y) <= 1:
             g.log.add_item(f"The {self.name} attacks!")
             return (pos.x, pos.y)
             
-        # Move towards player otherwise
+        # Move towards player otherwise, waiting if another actor is in the way
         else:
-            move = self.path.get_path(pos.x, pos.y, player.x, player.y)
-            if len(move) == 0: return (pos.x, pos.y)
-            return move[0]
+            x, y = dungeon.goal_map("player", ((player.x, player.y),)).next_step(pos.x, pos.y)
+            if dungeon.occupancy.blocked(x, y): return (pos.x, pos.y)
+            return (x, y)
         
 
+def enemy_perception(entities: Iterable[Entity], player: Position, dungeon: game.world_tools.Dungeon) -> None:
+    """Let every enemy in entities that hasn't noticed the player check whether it can see them.\n
+    Called once per turn with the awake actors. A single symmetric FOV from the player answers this for all enemies,
+    since an enemy can see the player exactly when the player can see the enemy."""
+    enemies = [entity for entity in entities if Enemy in entity.components and not entity.components[Enemy].noticed_player]
+    if not enemies: return
+    
+    visible = dungeon.visible_from(player.x, player.y)
+    for entity in enemies:
+        pos = entity.components[Position]
+        if not visible[pos.x, pos.y]: continue
+        enemy = entity.components[Enemy]
+        enemy.noticed_player = True
+        g.log.add_item(f"A {enemy.name} spotted you!")
+
 @tcod.ecs.callbacks.register_component_changed(component=Position)
 def on_position_changed(entity: Entity, old: Position | None, new : Position | None) -> None:
-    """Mirror position components as a tag."""
+    """Keep the occupancy grid of the entity's registry in sync with its position."""
     if old == new: return
-    if old is not None: entity.tags.discard(old)
-    if new is not None: entity.tags.add(new)
+    occupancy = Occupancy.of(entity.registry)
+    if old is None: occupancy.add(entity, new.x, new.y, blocking=Actor in entity.components or Enemy in entity.components)
+    elif new is None: occupancy.remove(entity, old.x, old.y)
+    else: occupancy.move(entity, old.x, old.y, new.x, new.y)
     
 @attrs.define(frozen=True)
 class Graphic:
@@ -71,6 +92,28 @@ class Graphic:
     ch: int = ord("!")                              # Character
     fg: tuple[int, int, int] = (255, 255, 255)      # Color
 
+@tcod.ecs.callbacks.register_component_changed(component=Position)
+def on_drawable_position_changed(entity: Entity, old: Position | None, new: Position | None) -> None:
+    """Keep the render cache of the entity's registry in sync with its position."""
+    if old == new: return
+    cache = RenderCache.of(entity.registry)
+    if new is None:
+        cache.remove(entity)
+    elif old is not None:
+        cache.move(entity, new.x, new.y)
+    elif Graphic in entity.components:
+        graphic = entity.components[Graphic]
+        cache.set(entity, new.x, new.y, graphic.ch, graphic.fg)
+
+@tcod.ecs.callbacks.register_component_changed(component=Graphic)
+def on_graphic_changed(entity: Entity, old: Graphic | None, new: Graphic | None) -> None:
+    cache = RenderCache.of(entity.registry)
+    if new is None:
+        cache.remove(entity)
+    elif Position in entity.components:
+        pos = entity.components[Position]
+        cache.set(entity, pos.x, pos.y, new.ch, new.fg)
+
 # @attrs.define(frozen=True)
 # class Box:
 
@@ -88,6 +131,20 @@ class Actor:
         g.current_actor = self
         g.log.add_item(self.interact_msg)
 
+def update_blocking(entity: Entity, blocking: bool) -> None:
+    """Mark whether an entity blocks its cell in the occupancy grid. Actors and enemies block."""
+    pos = entity.components.get(Position)
+    if pos is None: return
+    Occupancy.of(entity.registry).set_blocking(entity, pos.x, pos.y, blocking)
+
+@tcod.ecs.callbacks.register_component_changed(component=Actor)
+def on_actor_changed(entity: Entity, old: Actor | None, new: Actor | None) -> None:
+    if (old is None) != (new is None): update_blocking(entity, new is not None or Enemy in entity.components)
+
+@tcod.ecs.callbacks.register_component_changed(component=Enemy)
+def on_enemy_changed(entity: Entity, old: Enemy | None, new: Enemy | None) -> None:
+    if (old is None) != (new is None): update_blocking(entity, new is not None or Actor in entity.components)
+
 @attrs.define(frozen=False)
 class Transfer:
     """Transfers the player from one location to another."""
@@ -101,9 +158,35 @@ class Transfer:
         self.transfer_y = transfer_y
         self.is_down = is_down
 
+@attrs.define()
+class LevelStub:
+    """Bounds and source of a handcrafted level, kept while its LevelContainer is streamed in and out."""
+    path: str
+    id: str
+    x: int
+    y: int
+    width: int
+    height: int
+    field_instances: dict
+    saved_entities: list[tuple[dict, set]] | None = None     # Components and tags of the level's entities when it was last unloaded
+    
+    def within_bounds(self, x: int, y: int) -> bool:
+        """Returns true if the coordinates are within the bounding rectangle of the level."""
+        return 0 <= x - self.x <= self.width and 0 <= y - self.y <= self.height
+    
+    def overlaps(self, x: int, y: int, width: int, height: int) -> bool:
+        """Returns true if the level's tiles overlap the (x, y, width, height) rectangle."""
+        return self.x < x + width and x < self.x + self.width and self.y < y + height and y < self.y + self.height
+    
+    def distance(self, x: int, y: int) -> int:
+        """Chebyshev distance from (x, y) to the nearest tile of the level, 0 if inside."""
+        dx = max(self.x - x, 0, x - (self.x + self.width - 1))
+        dy = max(self.y - y, 0, y - (self.y + self.height - 1))
+        return max(dx, dy)
+
 @attrs.define(frozen=False)
 class LevelContainer:
-    """Stores JSON data for handcrafted levels."""
+    """Stores data for handcrafted levels, loaded by game.world_tools.load_level_data."""
     
     # Private fields
     x: int = attrs.field(init=False)
@@ -116,8 +199,16 @@ class LevelContainer:
     
     tiles: np.ndarray = attrs.field(init=False)
     id: str = attrs.field(init=False)
+    path: str = attrs.field(init=False)     # Exported file the level was loaded from
     
-    def __init__(self, data: map, world: tcod.ecs.Registry) -> None:
+    # Pre-rendered layers in console order [y, x]
+    ch: np.ndarray = attrs.field(init=False)
+    fg: np.ndarray = attrs.field(init=False)
+    drawn: np.ndarray = attrs.field(init=False)
+    
+    entities: list[Entity] = attrs.field(init=False)    # Entities spawned by this level
+    
+    def __init__(self, data: map, world: tcod.ecs.Registry, spawn_entities: bool = True) -> None:
         self.x = data["x"]
         self.y = data["y"]
         self.width = data["width"]
@@ -125,22 +216,30 @@ class LevelContainer:
         self.colors = np.reshape(data["colors"], (self.width, self.height), order="F")
         self.collision = np.reshape(data["collision"], (self.width, self.height), order="F")
         
-        x, y, t = [], [], []
-        for tile in data["tiles"]:
-            x.append(tile["x"])
-            y.append(tile["y"])
-            t.append(tile["t"])
-        tilesnd = np.zeros((self.width, self.height))
-        tilesnd[x, y] = t
-        self.tiles = tilesnd
+        if "tile_grid" in data:     # Packed level, already dense
+            self.tiles = np.reshape(data["tile_grid"], (self.width, self.height), order="F")
+        else:
+            x, y, t = [], [], []
+            for tile in data["tiles"]:
+                x.append(tile["x"])
+                y.append(tile["y"])
+                t.append(tile["t"])
+            tilesnd = np.zeros((self.width, self.height))
+            tilesnd[x, y] = t
+            self.tiles = tilesnd
         self.id = data["id"]
+        self.path = data.get("path", "")
+        self.render_layers()
         
         self.field_instances = {}
         for fi in data["field_instances"]:
             self.field_instances[fi["id"]] = fi["value"]
-            
+        
+        self.entities = []
+        if not spawn_entities: return
         for entity in data["entities"]:
             e = world[object()]
+            self.entities.append(e)
             e.components[Position] = Position(entity["x"] + self.x, entity["y"] + self.y)
             
             match entity["id"]:
@@ -155,6 +254,27 @@ class LevelContainer:
                     e.tags |= {IsActor}
                     
     
+    def render_layers(self) -> None:
+        """Convert tiles and colors into glyph and RGB layers ready to be blitted."""
+        tiles = self.tiles.astype(np.int32)
+        self.ch = CHARMAP_CP437_LUT[tiles].T     # CP437 to ASCII
+        self.fg = COLOR_PALLETE_LUT[self.colors].transpose(1, 0, 2)
+        self.drawn = (tiles != 0).T
+    
+    def draw(self, console: tcod.console.Console, offset_x: int, offset_y: int, width: int, height: int) -> None:
+        """Blit the part of this level overlapping the (offset_x, offset_y, width, height) viewport."""
+        if not self.overlaps(offset_x, offset_y, width, height): return   # Offscreen
+        left = max(self.x, offset_x)
+        right = min(self.x + self.width, offset_x + width)
+        top = max(self.y, offset_y)
+        bottom = min(self.y + self.height, offset_y + height)
+        
+        level_area = np.s_[top-self.y:bottom-self.y, left-self.x:right-self.x]
+        drawn = self.drawn[level_area]
+        view = console.rgb[top-offset_y:bottom-offset_y, left-offset_x:right-offset_x]
+        view["ch"] = np.where(drawn, self.ch[level_area], view["ch"])
+        view["fg"] = np.where(drawn[..., np.newaxis], self.fg[level_area], view["fg"])
+    
     # Top left corner is (0, 0) level local space
     # def level_visible(self, x: int, y: int, w: int, h: int) -> bool:
     #     """Returns true if any part of the level is on-screen."""
@@ -164,6 +284,10 @@ class LevelContainer:
         """Returns true if the coordinates are within the bounding rectangle of the level."""
         return 0 <= x - self.x <= self.width and 0 <= y - self.y <= self.height
     
+    def overlaps(self, x: int, y: int, width: int, height: int) -> bool:
+        """Returns true if the level's tiles overlap the (x, y, width, height) rectangle."""
+        return self.x < x + width and x < self.x + self.width and self.y < y + height and y < self.y + self.height
+    
     def is_space_occupied(self, x: int, y: int) -> bool:
         """Returns true if collision tile is marked as solid."""
         return self.collision[(x-self.x)%self.width, (y-self.y)%self.height] == 1
@@ -172,4 +296,10 @@ class LevelContainer:
     
 
 Gold: Final = ("Gold", int)
-"""Amount of gold."""
\ No newline at end of file
+"""Amount of gold."""
+
+WorldSeed: Final = ("WorldSeed", int)
+"""Seed every dungeon floor of a world is derived from."""
+
+Speed: Final = ("Speed", int)
+"""How quickly an actor acts, 100 is normal speed."""
@@ -1,6 +1,7 @@
 """Global constants are stored here."""
 from __future__ import annotations
 from typing import Final
+import numpy as np
 from tcod.event import KeySym
 
 ACCEPT_KEYS: Final = [
@@ -52,6 +53,9 @@ COLOR_PALLETE: Final = {
     7: (232, 183, 150)
 }
 
+COLOR_PALLETE_LUT: Final = np.array([COLOR_PALLETE[i] for i in range(len(COLOR_PALLETE))], dtype=np.uint8)
+"""COLOR_PALLETE as an array indexed by color id."""
+
 GAMEFRAME_LEFT: Final = 21
 GAMEFRAME_RIGHT: Final = 79
 GAMEFRAME_TOP: Final = 1
@@ -62,4 +66,34 @@ LOGFRAME_RIGHT: Final = 79
 LOGFRAME_TOP: Final = 41
 LOGFRAME_BOTTOM: Final = 49
 
-NOISE_COLLISION_THRESH = 0.5
\ No newline at end of file
+NOISE_COLLISION_THRESH = 0.5
+
+WORLD_SEED: Final = 10491049
+"""Default seed for overworld terrain and dungeon floors."""
+
+TERRAIN_PREFETCH_WORKERS: Final = 2
+"""Background processes used to bake overworld chunks ahead of the player. 0 disables prefetching."""
+
+TERRAIN_PREFETCH_RADIUS: Final = 2
+"""Chunks baked beyond the viewport in the player's direction of travel."""
+
+LEVEL_LOAD_RADIUS: Final = 64
+"""Levels within this many tiles of the player are loaded. Must cover the viewport."""
+
+LEVEL_UNLOAD_RADIUS: Final = 96
+"""Loaded levels further than this many tiles from the player are unloaded."""
+
+LEVEL_RELOAD_INTERVAL: Final = 0.5
+"""Seconds between polls of the level files when hot reloading."""
+
+RESIDENT_FLOORS: Final = 2
+"""Dungeon floors kept fully in memory: the current one and the one above it. Floors further up are frozen."""
+
+COLD_FLOOR_COMPRESSION: Final = 1
+"""zlib level used for the entities of frozen floors, 0 to store them uncompressed."""
+
+SAVE_PATH: Final = "data/save/session.sav"
+"""Where the game session is saved."""
+
+SAVE_POLL_INTERVAL: Final = 0.1
+"""Seconds between checks for a finished background save."""
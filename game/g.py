@@ -6,6 +6,9 @@ import numpy as np
 import game.components
 import game.state
 import game.menus
+import game.terrain
+import game.world_tools
+import game.save
 import tcod.context
 import tcod.ecs
 import tcod.sdl.audio
@@ -30,6 +33,9 @@ log: game.menus.LogMenu
 noise: tcod.noise.Noise
 """Sampler for generating terrain"""
 
+terrain: game.terrain.ChunkCache
+"""Cache of sampled terrain chunks."""
+
 grid: np.ndarray
 """Final rendered noise grid from this frame."""
 
@@ -38,6 +44,18 @@ current_actor: game.components.Actor = None
 
 dungeon: game.components.Dungeon
 
+floor_pregen: game.world_tools.FloorPregenerator
+"""Background generator for upcoming dungeon floors."""
+
+floor_cache: game.world_tools.FloorCache
+"""On-disk cache of generated dungeon floors."""
+
+save_writer: game.save.SaveWriter
+"""Background writer of saved sessions."""
+
+level_watcher: game.world_tools.LevelWatcher | None = None
+"""Reloads edited levels into g.world while the game runs, if enabled."""
+
 # Current idea:
 # - Use a constant seed game-wide
 # - Find interesting spots and place handcrafted encounters there
\ No newline at end of file
@@ -9,7 +9,7 @@ import tcod.console
 import tcod.event
 from tcod.event import KeySym
 import game.state_tools
-from game.state import Pop, State, StateResult
+from game.state import Pop, State, StateResult, Unchanged
 from game.constants import ACCEPT_KEYS, DIRECTION_KEYS
 
 class MenuItem(Protocol):
@@ -105,7 +105,9 @@ class ListMenu(State):
                 
             case tcod.event.MouseMotion(position=(_, y)):
                 y -= self.y
-                self.selected = y if 0 <= y < len(self.items) else None
+                selected = y if 0 <= y < len(self.items) else None
+                if selected == self.selected: return Unchanged()
+                self.selected = selected
                 return None
             
             case tcod.event.KeyDown(sym=KeySym.ESCAPE):
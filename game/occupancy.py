@@ -0,0 +1,130 @@
+"""Grids of the entities occupying each cell of a registry."""
+from __future__ import annotations
+from typing import Final
+import attrs
+import numpy as np
+import tcod.ecs
+from tcod.ecs import Entity
+
+CHUNK_SIZE: Final = 32
+"""Width and height of an occupancy chunk in cells."""
+
+EMPTY: Final = -1
+"""Slot of a cell without entities."""
+
+@attrs.define()
+class Occupancy:
+    """Sparse chunked grids answering what is at a cell and whether it's blocked with array lookups.\n
+    Stored on the global entity of each registry and kept in sync by the Position component callback.
+    Each entity takes a slot. The grid holds the first slot in each cell, and entities sharing a cell are chained
+    through next_slot. Chunks are created on demand, so the unbounded overworld works as well as a dungeon floor."""
+    heads: dict[tuple[int, int], np.ndarray] = attrs.Factory(dict)       # First slot in each cell, indexed [x, y]
+    blockers: dict[tuple[int, int], np.ndarray] = attrs.Factory(dict)    # Number of blocking entities in each cell
+    slots: dict[Entity, int] = attrs.Factory(dict)
+    entities: list[Entity | None] = attrs.Factory(list)
+    next_slot: list[int] = attrs.Factory(list)
+    blocking: list[bool] = attrs.Factory(list)
+    free: list[int] = attrs.Factory(list)
+    version: int = 0    # Bumped whenever a blocker is added, moved or removed
+
+    @classmethod
+    def of(cls, registry: tcod.ecs.Registry) -> Occupancy:
+        """Returns the occupancy of registry, creating it on first use."""
+        occupancy = registry[None].components.get(cls)
+        if occupancy is None:
+            occupancy = registry[None].components[cls] = cls()
+        return occupancy
+
+    def _chunk(self, x: int, y: int) -> tuple[np.ndarray, np.ndarray]:
+        key = (x // CHUNK_SIZE, y // CHUNK_SIZE)
+        heads = self.heads.get(key)
+        if heads is None:
+            heads = self.heads[key] = np.full((CHUNK_SIZE, CHUNK_SIZE), EMPTY, dtype=np.int32)
+            self.blockers[key] = np.zeros((CHUNK_SIZE, CHUNK_SIZE), dtype=np.uint16)
+        return heads, self.blockers[key]
+
+    def add(self, entity: Entity, x: int, y: int, blocking: bool) -> None:
+        if self.free:
+            slot = self.free.pop()
+            self.entities[slot] = entity
+            self.blocking[slot] = blocking
+        else:
+            slot = len(self.entities)
+            self.entities.append(entity)
+            self.next_slot.append(EMPTY)
+            self.blocking.append(blocking)
+        self.slots[entity] = slot
+        self._link(slot, x, y)
+
+    def remove(self, entity: Entity, x: int, y: int) -> None:
+        slot = self.slots.pop(entity, None)
+        if slot is None: return
+        self._unlink(slot, x, y)
+        self.entities[slot] = None
+        self.free.append(slot)
+
+    def move(self, entity: Entity, old_x: int, old_y: int, new_x: int, new_y: int) -> None:
+        slot = self.slots.get(entity)
+        if slot is None: return
+        self._unlink(slot, old_x, old_y)
+        self._link(slot, new_x, new_y)
+
+    def set_blocking(self, entity: Entity, x: int, y: int, blocking: bool) -> None:
+        slot = self.slots.get(entity)
+        if slot is None or self.blocking[slot] == blocking: return
+        self.blocking[slot] = blocking
+        _, blockers = self._chunk(x, y)
+        blockers[x % CHUNK_SIZE, y % CHUNK_SIZE] += 1 if blocking else -1
+        self.version += 1
+
+    def _link(self, slot: int, x: int, y: int) -> None:
+        heads, blockers = self._chunk(x, y)
+        local = (x % CHUNK_SIZE, y % CHUNK_SIZE)
+        self.next_slot[slot] = int(heads[local])
+        heads[local] = slot
+        if self.blocking[slot]:
+            blockers[local] += 1
+            self.version += 1
+
+    def _unlink(self, slot: int, x: int, y: int) -> None:
+        heads, blockers = self._chunk(x, y)
+        local = (x % CHUNK_SIZE, y % CHUNK_SIZE)
+        if heads[local] == slot:
+            heads[local] = self.next_slot[slot]
+        else:
+            previous = int(heads[local])
+            while self.next_slot[previous] != slot:
+                previous = self.next_slot[previous]
+            self.next_slot[previous] = self.next_slot[slot]
+        self.next_slot[slot] = EMPTY
+        if self.blocking[slot]:
+            blockers[local] -= 1
+            self.version += 1
+
+    def at(self, x: int, y: int) -> list[Entity]:
+        """Returns the entities at (x, y), most recently arrived first."""
+        heads = self.heads.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if heads is None: return []
+        found = []
+        slot = int(heads[x % CHUNK_SIZE, y % CHUNK_SIZE])
+        while slot != EMPTY:
+            found.append(self.entities[slot])
+            slot = self.next_slot[slot]
+        return found
+
+    def blocked(self, x: int, y: int) -> bool:
+        """Returns true if a blocking entity is at (x, y)."""
+        blockers = self.blockers.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        return blockers is not None and blockers[x % CHUNK_SIZE, y % CHUNK_SIZE] != 0
+
+    def blocked_area(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        """Returns a bool mask of blocked cells in a region, indexed [x, y]."""
+        out = np.zeros((width, height), dtype=bool)
+        for cx in range(x // CHUNK_SIZE, (x + width - 1) // CHUNK_SIZE + 1):
+            for cy in range(y // CHUNK_SIZE, (y + height - 1) // CHUNK_SIZE + 1):
+                blockers = self.blockers.get((cx, cy))
+                if blockers is None: continue
+                left, top = max(x, cx * CHUNK_SIZE), max(y, cy * CHUNK_SIZE)
+                right, bottom = min(x + width, (cx + 1) * CHUNK_SIZE), min(y + height, (cy + 1) * CHUNK_SIZE)
+                out[left - x:right - x, top - y:bottom - y] = blockers[left - cx * CHUNK_SIZE:right - cx * CHUNK_SIZE, top - cy * CHUNK_SIZE:bottom - cy * CHUNK_SIZE] != 0
+        return out
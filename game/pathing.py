@@ -0,0 +1,61 @@
+"""Shared pathfinding fields used by AI."""
+from __future__ import annotations
+from typing import Final
+import attrs
+import numpy as np
+import tcod.path
+
+CARDINAL_COST: Final = 2
+DIAGONAL_COST: Final = 3
+UNREACHABLE: Final = np.iinfo(np.int32).max
+
+# Cardinal directions come first so they win ties
+DIRECTIONS: Final = ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, -1), (-1, 1), (1, 1))
+
+@attrs.define()
+class GoalMap:
+    """Dijkstra distance field towards a set of goals, with the best next step from every tile.\n
+    One map is shared by every actor heading to the same goals, so each actor's move is an array lookup."""
+    goals: tuple[tuple[int, int], ...]
+    distance: np.ndarray        # Indexed [x, y], UNREACHABLE where no goal can be reached
+    step_x: np.ndarray
+    step_y: np.ndarray
+
+    @classmethod
+    def towards(cls, cost: np.ndarray, goals: tuple[tuple[int, int], ...]) -> GoalMap:
+        """Build a map leading to the nearest of goals. Tiles with a cost of 0 are blocked."""
+        distance = tcod.path.maxarray(cost.shape, dtype=np.int32)
+        for x, y in goals:
+            distance[x, y] = 0
+        tcod.path.dijkstra2d(distance, cost, CARDINAL_COST, DIAGONAL_COST, out=distance)
+        return cls.from_distance(goals, distance)
+
+    @classmethod
+    def away_from(cls, cost: np.ndarray, source: GoalMap, coefficient: float = -1.2) -> GoalMap:
+        """Build a fleeing map from source by inverting its distances and rescanning.\n
+        A coefficient below -1 makes actors prefer escape routes over backing into corners."""
+        reachable = source.distance != UNREACHABLE
+        distance = tcod.path.maxarray(cost.shape, dtype=np.int32)
+        distance[reachable] = (source.distance[reachable] * coefficient).astype(np.int32)
+        tcod.path.dijkstra2d(distance, cost, CARDINAL_COST, DIAGONAL_COST, out=distance)
+        return cls.from_distance(source.goals, distance)
+
+    @classmethod
+    def from_distance(cls, goals: tuple[tuple[int, int], ...], distance: np.ndarray) -> GoalMap:
+        """Precompute the downhill neighbour of every tile."""
+        padded = np.pad(distance, 1, constant_values=UNREACHABLE)
+        best = distance.copy()
+        step_x = np.zeros(distance.shape, dtype=np.int8)
+        step_y = np.zeros(distance.shape, dtype=np.int8)
+        width, height = distance.shape
+        for dx, dy in DIRECTIONS:
+            neighbour = padded[1+dx:1+dx+width, 1+dy:1+dy+height]
+            better = neighbour < best
+            best[better] = neighbour[better]
+            step_x[better] = dx
+            step_y[better] = dy
+        return cls(goals=goals, distance=distance, step_x=step_x, step_y=step_y)
+
+    def next_step(self, x: int, y: int) -> tuple[int, int]:
+        """Returns the tile to move to from (x, y), or (x, y) if there's no better tile."""
+        return x + int(self.step_x[x, y]), y + int(self.step_y[x, y])
@@ -0,0 +1,91 @@
+"""Lightweight timers and counters for finding where frame time goes."""
+from __future__ import annotations
+from collections import deque
+from collections.abc import Callable
+from typing import Final, ParamSpec, TypeVar
+import csv
+import functools
+import json
+import time
+import attrs
+import numpy as np
+
+WINDOW: Final = 240
+"""Number of recent samples per section used for rolling percentiles."""
+
+MAX_TRACE: Final = 200_000
+"""Trace events kept for export. The oldest are dropped first."""
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+@attrs.define()
+class Profiler:
+    """Collects named section timings and counters while enabled.\n
+    Sections keep a rolling window for the overlay, and every sample is also kept in a bounded trace for export."""
+    enabled: bool = False
+    samples: dict[str, deque[float]] = attrs.Factory(dict)     # Rolling durations in seconds
+    counters: dict[str, int] = attrs.Factory(dict)
+    trace: deque[tuple[str, float, float]] = attrs.Factory(lambda: deque(maxlen=MAX_TRACE))    # (name, start, duration)
+    origin: float = attrs.Factory(time.perf_counter)
+
+    def record(self, name: str, start: float, duration: float) -> None:
+        window = self.samples.get(name)
+        if window is None:
+            window = self.samples[name] = deque(maxlen=WINDOW)
+        window.append(duration)
+        self.counters[name] = self.counters.get(name, 0) + 1
+        self.trace.append((name, start - self.origin, duration))
+
+    def count(self, name: str, amount: int = 1) -> None:
+        if not self.enabled: return
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def percentiles(self, name: str) -> tuple[float, float]:
+        """Return the rolling p50 and p99 of a section in milliseconds."""
+        p50, p99 = np.percentile(np.fromiter(self.samples[name], dtype=np.float64), (50, 99)) * 1000
+        return float(p50), float(p99)
+
+    def toggle(self) -> None:
+        self.enabled = not self.enabled
+
+    def clear(self) -> None:
+        self.samples.clear()
+        self.counters.clear()
+        self.trace.clear()
+
+    def export(self, path: str) -> None:
+        """Write the trace to path, as CSV if it ends in .csv, otherwise as a Chrome trace event JSON file."""
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(("section", "start_ms", "duration_ms"))
+                for name, start, duration in self.trace:
+                    writer.writerow((name, f"{start * 1000:.4f}", f"{duration * 1000:.4f}"))
+            return
+
+        events = [
+            {"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6, "pid": 0, "tid": 0}
+            for name, start, duration in self.trace
+        ]
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "counters": self.counters}, file)
+
+profiler: Final = Profiler()
+"""Shared profiler used by the timed decorator."""
+
+def timed(name: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Decorator recording the duration of each call as section name while the profiler is enabled.\n
+    When disabled the only overhead is one attribute check."""
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(name, start, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,35 @@
+"""Direct handles to entities that hot paths would otherwise find with ECS queries."""
+from __future__ import annotations
+import attrs
+import tcod.ecs
+from tcod.ecs import Entity
+from game.tags import IsPlayer
+
+@attrs.define()
+class Queries:
+    """Handles to well-known entities of a registry, kept so drawing and events don't run a query for them.\n
+    Stored on the global entity of each registry and saved with it. Besides the cost of building a query every call,
+    tcod-ecs keeps every registry that ran a query alive for the rest of the process, so the old world of every new or
+    loaded game would leak. A handle is checked against its tag on every use and only then queried again."""
+    registry: tcod.ecs.Registry
+    player_entity: Entity | None = None
+    hits: int = 0           # Lookups answered by a handle that was still valid
+    rebuilds: int = 0       # Lookups that had to query again
+
+    @classmethod
+    def of(cls, registry: tcod.ecs.Registry) -> Queries:
+        """Returns the handles of registry, creating them on first use."""
+        queries = registry[None].components.get(cls)
+        if queries is None:
+            queries = registry[None].components[cls] = cls(registry)
+        return queries
+
+    @property
+    def player(self) -> Entity:
+        """The player entity. new_world sets the handle, so this only queries if the player changed since."""
+        if self.player_entity is not None and IsPlayer in self.player_entity.tags:
+            self.hits += 1
+            return self.player_entity
+        self.rebuilds += 1
+        (self.player_entity,) = self.registry.Q.all_of(tags=[IsPlayer])
+        return self.player_entity
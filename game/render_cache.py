@@ -0,0 +1,93 @@
+"""Struct-of-arrays cache of drawable entities for batched drawing."""
+from __future__ import annotations
+import attrs
+import numpy as np
+import tcod.console
+import tcod.ecs
+from tcod.ecs import Entity
+
+@attrs.define()
+class RenderCache:
+    """Positions and glyphs of every entity with a Position and Graphic in a registry, stored as parallel arrays.\n
+    Stored on the global entity of each registry and kept in sync by component callbacks,
+    so drawing is a vectorized cull and a single scatter into the console instead of a loop over entities."""
+    x: np.ndarray = attrs.Factory(lambda: np.zeros(0, dtype=np.int32))
+    y: np.ndarray = attrs.Factory(lambda: np.zeros(0, dtype=np.int32))
+    ch: np.ndarray = attrs.Factory(lambda: np.zeros(0, dtype=np.int32))
+    fg: np.ndarray = attrs.Factory(lambda: np.zeros((0, 3), dtype=np.uint8))
+    alive: np.ndarray = attrs.Factory(lambda: np.zeros(0, dtype=bool))
+    slots: dict[Entity, int] = attrs.Factory(dict)
+    free: list[int] = attrs.Factory(list)
+    count: int = 0      # Slots ever used, the arrays past this are unused capacity
+
+    @classmethod
+    def of(cls, registry: tcod.ecs.Registry) -> RenderCache:
+        """Returns the render cache of registry, creating it on first use."""
+        cache = registry[None].components.get(cls)
+        if cache is None:
+            cache = registry[None].components[cls] = cls()
+        return cache
+
+    def _grow(self) -> None:
+        capacity = max(64, len(self.alive) * 2)
+        for name in ("x", "y", "ch", "fg", "alive"):
+            old = getattr(self, name)
+            new = np.zeros((capacity, *old.shape[1:]), dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def set(self, entity: Entity, x: int, y: int, ch: int, fg: tuple[int, int, int]) -> None:
+        """Add or update a drawable entity."""
+        slot = self.slots.get(entity)
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+            else:
+                if self.count == len(self.alive): self._grow()
+                slot = self.count
+                self.count += 1
+            self.slots[entity] = slot
+            self.alive[slot] = True
+        self.x[slot] = x
+        self.y[slot] = y
+        self.ch[slot] = ch
+        self.fg[slot] = fg
+
+    def move(self, entity: Entity, x: int, y: int) -> None:
+        slot = self.slots.get(entity)
+        if slot is None: return
+        self.x[slot] = x
+        self.y[slot] = y
+
+    def remove(self, entity: Entity) -> None:
+        slot = self.slots.pop(entity, None)
+        if slot is None: return
+        self.alive[slot] = False
+        self.free.append(slot)
+
+    def draw(
+        self,
+        console: tcod.console.Console,
+        offset_x: int,
+        offset_y: int,
+        bounds: tuple[int, int, int, int],
+        visible: np.ndarray | None = None,
+    ) -> None:
+        """Draw every cached entity inside bounds, a (left, top, right, bottom) console rectangle.\n
+        If visible is given, only entities on its True cells, indexed [x, y] in world space, are drawn."""
+        n = self.count
+        x = self.x[:n] - offset_x
+        y = self.y[:n] - offset_y
+        left, top, right, bottom = bounds
+        mask = self.alive[:n] & (left <= x) & (x < right) & (top <= y) & (y < bottom)
+        if visible is not None:
+            world_x, world_y = self.x[:n], self.y[:n]
+            mask &= (0 <= world_x) & (world_x < visible.shape[0]) & (0 <= world_y) & (world_y < visible.shape[1])
+            mask[mask] = visible[world_x[mask], world_y[mask]]
+        index = np.flatnonzero(mask)
+        if not len(index): return
+        cells = np.empty(len(index), dtype=console.rgb.dtype)
+        cells["ch"] = self.ch[index]
+        cells["fg"] = self.fg[index]
+        cells["bg"] = 0
+        console.rgb[y[index], x[index]] = cells
@@ -0,0 +1,123 @@
+"""Saving and loading of whole game sessions."""
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Final
+import io
+import logging
+import os
+import pickle
+import struct
+import attrs
+import game.components as gc
+import game.world_tools
+
+logger = logging.getLogger(__name__)
+
+SAVE_MAGIC: Final = b"CSAV"
+SAVE_VERSION: Final = 1
+SAVE_PREFIX: Final = struct.Struct("<4sIQI")
+"""Magic, version, pickle size and buffer count of a save file."""
+
+BUFFER_ALIGNMENT: Final = 16
+
+class SessionPickler(pickle.Pickler):
+    """Pickles loaded levels by reference to their exported file instead of copying their layers."""
+    def persistent_id(self, obj: object) -> tuple | None:
+        if isinstance(obj, gc.LevelContainer):
+            return ("LevelContainer", obj.path, obj.entities)
+        return None
+
+class SessionUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid: tuple) -> object:
+        kind, path, entities = pid
+        if kind != "LevelContainer":
+            raise pickle.UnpicklingError(f"Unknown persistent object {kind}")
+        container = gc.LevelContainer(game.world_tools.load_level_data(path), world=None, spawn_entities=False)
+        container.entities = entities
+        return container
+
+
+@attrs.define(frozen=True)
+class Snapshot:
+    """Serialized session. The pickle refers to NumPy arrays stored out of band as raw buffers."""
+    data: bytes
+    buffers: list[bytes]
+
+def snapshot_session(session: dict) -> Snapshot:
+    """Serialize session. Array contents are copied so the live session can change while the snapshot is written."""
+    buffers: list[bytes] = []
+    file = io.BytesIO()
+    SessionPickler(file, protocol=5, buffer_callback=lambda buffer: buffers.append(bytes(buffer.raw()))).dump(session)
+    return Snapshot(data=file.getvalue(), buffers=buffers)
+
+def write_snapshot(snapshot: Snapshot, path: str) -> None:
+    """Write snapshot to path atomically.\n
+    Layout: prefix, buffer sizes as uint64, pickle, then each buffer padded to BUFFER_ALIGNMENT bytes."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(SAVE_PREFIX.pack(SAVE_MAGIC, SAVE_VERSION, len(snapshot.data), len(snapshot.buffers)))
+        f.write(struct.pack(f"<{len(snapshot.buffers)}Q", *(len(buffer) for buffer in snapshot.buffers)))
+        f.write(snapshot.data)
+        for buffer in snapshot.buffers:
+            f.write(bytes(-f.tell() % BUFFER_ALIGNMENT))
+            f.write(buffer)
+    os.replace(tmp, path)
+
+def read_session(path: str) -> dict:
+    """Read a session written by write_snapshot. Arrays are views of the file contents, not copies."""
+    with open(path, "rb") as f:
+        raw = bytearray(os.fstat(f.fileno()).st_size)
+        f.readinto(raw)
+    magic, version, data_size, buffer_count = SAVE_PREFIX.unpack_from(raw)
+    if magic != SAVE_MAGIC or version != SAVE_VERSION:
+        raise ValueError(f"{path} is not a version {SAVE_VERSION} save")
+    sizes = struct.unpack_from(f"<{buffer_count}Q", raw, SAVE_PREFIX.size)
+    position = SAVE_PREFIX.size + 8 * buffer_count
+    view = memoryview(raw)
+    data = view[position:position + data_size]
+    position += data_size
+    buffers = []
+    for size in sizes:
+        position += -position % BUFFER_ALIGNMENT
+        buffers.append(view[position:position + size])
+        position += size
+    return SessionUnpickler(io.BytesIO(data), buffers=buffers).load()
+
+
+@attrs.define()
+class SaveWriter:
+    """Writes session snapshots on a background thread so saving doesn't stall the frame.\n
+    Only taking the snapshot happens on the calling thread."""
+    executor: ThreadPoolExecutor | None = None
+    pending: Future[None] | None = None
+
+    def save(self, session: dict, path: str) -> Future[None]:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="save")   # One worker keeps saves in order
+        snapshot = snapshot_session(session)
+        self.pending = self.executor.submit(write_snapshot, snapshot, path)
+        self.pending.add_done_callback(self._log_result)
+        return self.pending
+
+    @staticmethod
+    def _log_result(future: Future[None]) -> None:
+        if future.exception() is not None:
+            logger.error("Saving failed", exc_info=future.exception())
+
+    def collect(self) -> Future[None] | None:
+        """Return the last save once it's finished, or None if it's still running or was already collected."""
+        if self.pending is None or not self.pending.done(): return None
+        finished, self.pending = self.pending, None
+        return finished
+
+    def wait(self) -> None:
+        """Block until the last save is written."""
+        if self.pending is not None:
+            self.pending.exception()
+
+    def shutdown(self) -> None:
+        """Finish queued saves and stop the background thread."""
+        if self.executor is None: return
+        self.executor.shutdown(wait=True)
+        self.executor = None
@@ -0,0 +1,97 @@
+"""Energy based turn scheduling for actors."""
+from __future__ import annotations
+from collections.abc import Callable, Iterable
+from typing import Final
+import heapq
+import attrs
+from tcod.ecs import Entity
+import game.components as gc
+
+ACTION_COST: Final = 100
+"""Time taken by one action at normal speed. The player's turn always lasts this long."""
+
+NORMAL_SPEED: Final = 100
+"""Speed of actors without a Speed component."""
+
+@attrs.define()
+class TurnScheduler:
+    """Priority queue of awake actors keyed by the time of their next action.\n
+    Actors far from the player that haven't noticed them are put to sleep in coarse spatial buckets
+    and skipped entirely until the player comes near, so a turn costs only as much as its awake actors."""
+    wake_radius: int = 24
+    bucket_size: int = 16
+    time: int = 0
+    queue: list[tuple[int, int, Entity]] = attrs.Factory(list)
+    scheduled: dict[Entity, int] = attrs.Factory(dict)     # Awake actors and the sequence number of their live queue entry
+    sleeping: dict[tuple[int, int], set[Entity]] = attrs.Factory(dict)
+    sleeping_at: dict[Entity, tuple[int, int]] = attrs.Factory(dict)
+    counter: int = 0     # Next queue entry sequence number
+
+    def add(self, entity: Entity, delay: int = 0) -> None:
+        """Wake entity and schedule it to act after delay."""
+        self._unsleep(entity)
+        self._schedule(entity, self.time + delay)
+
+    def remove(self, entity: Entity) -> None:
+        self._unsleep(entity)
+        self.scheduled.pop(entity, None)
+
+    def awake(self) -> Iterable[Entity]:
+        return self.scheduled.keys()
+
+    def run_turn(self, center: gc.Position, act: Callable[[Entity], None], duration: int = ACTION_COST) -> None:
+        """Advance time by duration, letting every awake actor due in that time act in order.\n
+        center is the player's position, used to wake and sleep actors."""
+        self.wake_near(center)
+        end = self.time + duration
+        while self.queue and self.queue[0][0] < end:
+            time, sequence, entity = heapq.heappop(self.queue)
+            if self.scheduled.get(entity) != sequence: continue     # Removed, asleep or rescheduled
+            if self.can_sleep(entity, center):
+                self.sleep(entity)
+                continue
+            act(entity)
+            if self.scheduled.get(entity) == sequence:    # act may have removed or rescheduled it
+                self._schedule(entity, time + self.action_cost(entity))
+        self.time = end
+
+    def action_cost(self, entity: Entity) -> int:
+        return ACTION_COST * NORMAL_SPEED // max(1, entity.components.get(gc.Speed, NORMAL_SPEED))
+
+    def can_sleep(self, entity: Entity, center: gc.Position) -> bool:
+        if gc.Enemy in entity.components and entity.components[gc.Enemy].noticed_player: return False
+        pos = entity.components[gc.Position]
+        return max(abs(pos.x - center.x), abs(pos.y - center.y)) > self.wake_radius
+
+    def sleep(self, entity: Entity) -> None:
+        self.scheduled.pop(entity, None)
+        pos = entity.components[gc.Position]
+        key = (pos.x // self.bucket_size, pos.y // self.bucket_size)
+        self.sleeping.setdefault(key, set()).add(entity)
+        self.sleeping_at[entity] = key
+
+    def wake_near(self, center: gc.Position) -> None:
+        """Wake sleeping actors within wake_radius of center, only visiting nearby buckets."""
+        low_x, high_x = (center.x - self.wake_radius) // self.bucket_size, (center.x + self.wake_radius) // self.bucket_size
+        low_y, high_y = (center.y - self.wake_radius) // self.bucket_size, (center.y + self.wake_radius) // self.bucket_size
+        for bx in range(low_x, high_x + 1):
+            for by in range(low_y, high_y + 1):
+                bucket = self.sleeping.get((bx, by))
+                if not bucket: continue
+                for entity in list(bucket):
+                    pos = entity.components[gc.Position]
+                    if max(abs(pos.x - center.x), abs(pos.y - center.y)) <= self.wake_radius:
+                        self.add(entity)
+
+    def _schedule(self, entity: Entity, time: int) -> None:
+        sequence = self.counter
+        self.counter += 1
+        self.scheduled[entity] = sequence
+        heapq.heappush(self.queue, (time, sequence, entity))
+
+    def _unsleep(self, entity: Entity) -> None:
+        key = self.sleeping_at.pop(entity, None)
+        if key is None: return
+        bucket = self.sleeping[key]
+        bucket.discard(entity)
+        if not bucket: del self.sleeping[key]
@@ -33,5 +33,9 @@ class Reset:
     """Replace the entire stack with a new state."""
     state: State
     
-StateResult: TypeAlias = "Push | Pop | Reset | None"
+@attrs.define()
+class Unchanged:
+    """Leave the stack as is. The event changed nothing on screen, so the next redraw can be skipped."""
+    
+StateResult: TypeAlias = "Push | Pop | Reset | Unchanged | None"
 """Union of state results."""
\ No newline at end of file
@@ -1,20 +1,32 @@
 """Handles events and rendering of the global state."""
 from __future__ import annotations
 
+from collections.abc import Iterable, Iterator
+from typing import TextIO
+
 from game import g
-from game.state import Pop, Push, Reset, State, StateResult
+from game.constants import SAVE_POLL_INTERVAL
+from game.state import Pop, Push, Reset, State, StateResult, Unchanged
+from game.profiling import timed
 
 import tcod.context
 import tcod.ecs
+import tcod.event
+
+def render(console: tcod.console.Console) -> None:
+    """Draw the active state onto console without presenting it."""
+    console.clear()
+    g.states[-1].on_draw(console)
 
+@timed("frame")
 def main_draw() -> None:
     if not g.states:
         return
-    g.console.clear()
-    g.states[-1].on_draw(g.console)
+    render(g.console)
     g.context.present(g.console, integer_scaling=True)
 
-def apply_state_result(result: StateResult) -> None:
+def apply_state_result(result: StateResult) -> bool:
+    """Apply result to the state stack. Returns False if the display doesn't need redrawing."""
     match result:
         case Push(state=state):
             g.states.append(state)
@@ -24,18 +36,53 @@ def apply_state_result(result: StateResult) -> None:
             while g.states:
                 apply_state_result(Pop(state))
             apply_state_result(Push(state))
+        case Unchanged():
+            return False
         case None:
             pass
         case _:
             raise TypeError(result)
+    return True
+
+def coalesce_events(events: Iterable[tcod.event.Event]) -> Iterator[tcod.event.Event]:
+    """Drop queued events that would be overwritten by a later event in the same batch.\n
+    A run of auto-repeated presses of one key becomes a single press, so holding a key can't queue up moves
+    faster than they're handled, and a run of mouse motion becomes its final position."""
+    pending: tcod.event.Event | None = None
+    for event in events:
+        if pending is not None and not (
+            isinstance(event, tcod.event.KeyDown) and event.repeat and isinstance(pending, tcod.event.KeyDown) and pending.repeat and pending.sym == event.sym
+            or isinstance(event, tcod.event.MouseMotion) and isinstance(pending, tcod.event.MouseMotion)
+        ):
+            yield pending
+        pending = event
+    if pending is not None:
+        yield pending
         
-def main_loop() -> None:
+def main_loop(record: TextIO | None = None) -> None:
+    """Run the game until no states remain. Key presses are written to record if given.\n
+    The screen is only redrawn after a batch of events changed something."""
+    dirty = True
     while g.states:         # Exit if no state exists
-        main_draw()
-        for event in tcod.event.wait():
+        if g.level_watcher is not None and hasattr(g, "world"):
+            dirty |= g.level_watcher.update(g.world)
+        saved = g.save_writer.collect()
+        if saved is not None:
+            g.log.add_item("Game saved." if saved.exception() is None else "Saving failed.")
+            dirty = True
+        if dirty: main_draw()
+        dirty = False
+        # Wake up to poll for edited levels and finished saves
+        timeouts = [g.level_watcher.interval] if g.level_watcher is not None else []
+        if g.save_writer.pending is not None: timeouts.append(SAVE_POLL_INTERVAL)
+        timeout = min(timeouts, default=None)
+        for event in coalesce_events(tcod.event.wait(timeout)):
+            if record is not None and isinstance(event, tcod.event.KeyDown):
+                record.write(f"{event.sym.name}\n")
+            if isinstance(event, tcod.event.WindowEvent): dirty = True     # Exposed, resized, etc.
             tile_event = g.context.convert_event(event)     # Mouse coord events should be converted to tiles
             if g.states:
-                apply_state_result(g.states[-1].on_event(tile_event))   # Pass event and handle potential state changes at the same time
+                dirty |= apply_state_result(g.states[-1].on_event(tile_event))   # Pass event and handle potential state changes at the same time
             
 def get_previous_state(state: State) -> State | None:
     current_index = next(index for index, value in enumerate(g.states) if value is state)
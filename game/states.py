@@ -9,17 +9,27 @@ import numpy as np
 from tcod.event import KeySym
 import game.constants
 import game.g as g
-from game.components import Gold, Graphic, Position, Actor, LevelContainer, Transfer, Enemy
-from game.constants import DIRECTION_KEYS, NOISE_COLLISION_THRESH, GAMEFRAME_LEFT, GAMEFRAME_RIGHT, GAMEFRAME_TOP, GAMEFRAME_BOTTOM, LOGFRAME_BOTTOM, LOGFRAME_TOP, LOGFRAME_RIGHT, LOGFRAME_LEFT
-from game.tags import IsItem, IsPlayer
-from game.state import State, StateResult, Pop, Push, Reset
+from game.components import Gold, Graphic, Position, Actor, LevelContainer, LevelStub, Transfer, Enemy, WorldSeed, enemy_perception
+from game.constants import RESIDENT_FLOORS, DIRECTION_KEYS, NOISE_COLLISION_THRESH, GAMEFRAME_LEFT, GAMEFRAME_RIGHT, GAMEFRAME_TOP, GAMEFRAME_BOTTOM, LOGFRAME_BOTTOM, LOGFRAME_TOP, LOGFRAME_RIGHT, LOGFRAME_LEFT
+from game.tags import IsItem
+from game.state import State, StateResult, Pop, Push, Reset, Unchanged
 import game.menus
 import game.world_tools
+import game.terrain
+import game.save
+from game.occupancy import Occupancy
+from game.render_cache import RenderCache
+from game.queries import Queries
+import os
+from game.profiling import profiler, timed
 from tcod import libtcodpy
 from random import Random
+import logging
 
 from game.utils import clamp
 
+logger = logging.getLogger(__name__)
+
 @attrs.define()
 class MainMenu(game.menus.ListMenu):
     """Main menu state."""
@@ -33,9 +43,12 @@ class MainMenu(game.menus.ListMenu):
             game.menus.SelectItem("Quit", self.quit)
         ]
         
-        # Continue if world already exists from this session
-        if hasattr(g, "world"):
+        # Continue and save if a game is in progress
+        if any(isinstance(state, InGame) for state in g.states):
             items.insert(0, game.menus.SelectItem("Continue", self.continue_))
+            items.insert(1, game.menus.SelectItem("Save game", self.save_game))
+        if os.path.exists(game.constants.SAVE_PATH):
+            items.insert(-1, game.menus.SelectItem("Load game", self.load_game))
             
         super().__init__(
             items = tuple(items),
@@ -51,9 +64,21 @@ class MainMenu(game.menus.ListMenu):
         return Reset(InGame())
 
     
-    @staticmethod        
-    def continue_():
-        return Reset(InGame())
+    def continue_(self) -> StateResult:
+        return Pop(self)
+    
+    def save_game(self) -> StateResult:
+        ingame = next(state for state in reversed(g.states) if isinstance(state, InGame))
+        g.save_writer.save(ingame.session(), game.constants.SAVE_PATH)
+        g.log.add_item("Saving...")     # The main loop reports the result once the write finishes
+        return Pop(self)
+    
+    @staticmethod
+    def load_game() -> StateResult:
+        g.save_writer.wait()    # Don't read a save that's still being written
+        state = InGame.from_session(game.save.read_session(game.constants.SAVE_PATH))
+        g.log.add_item("Game loaded.")
+        return Reset(state)
     
     @staticmethod        
     def quit():
@@ -65,7 +90,8 @@ class InGame(State):
     """Primary in-game state.\n
     States will always use g.world to access the ECS registry."""
     
-    dungeon_floors: list[game.world_tools.Dungeon] = []
+    dungeon_floors: list[game.world_tools.Dungeon | game.world_tools.ColdFloor] = []    # Only the last RESIDENT_FLOORS are Dungeons
+    explored_floors: dict[int, np.ndarray] = {}     # Bit-packed explored maps of floors that were left, by depth
     area_name: str = ""
     
     def __init__(self) -> None:
@@ -73,6 +99,8 @@ class InGame(State):
         g.log = game.menus.LogMenu(x=21, y=48, w=58, h=8)
         self.update_area_name("World of Wowzers")
         self.dungeon_floors = []
+        self.explored_floors = {}
+        self.prefetch_floor(1)
         # Play music
         # if hasattr(g, "mixer"):
         #     g.mixer.stop()
@@ -81,38 +109,117 @@ class InGame(State):
         # sound = g.mixer.device.convert(sound, sample_rate)
         # channel = g.mixer.play(sound, volume=0.25)
     
+    def session(self) -> dict:
+        """Everything needed to restore this game with from_session."""
+        return {
+            "world": g.world,
+            "log": g.log,
+            "current_actor": g.current_actor,
+            "dungeon_floors": self.dungeon_floors,
+            "explored_floors": self.explored_floors,
+            "area_name": self.area_name,
+        }
+    
+    @classmethod
+    def from_session(cls, session: dict) -> InGame:
+        """Restore a game saved with session, replacing the global world."""
+        self = cls.__new__(cls)
+        g.world = session["world"]
+        g.log = session["log"]
+        g.current_actor = session["current_actor"]
+        self.dungeon_floors = session["dungeon_floors"]
+        self.explored_floors = session["explored_floors"]
+        self.area_name = session["area_name"]
+        self.prefetch_floor(len(self.dungeon_floors) + 1)
+        return self
+    
     def update_area_name(self, name: str) -> None:
         self.area_name = name
     
+    def floor_params(self, depth: int) -> dict:
+        """Generation parameters of the dungeon floor at depth, starting at 1."""
+        seed = game.world_tools.floor_seed(g.world[None].components[WorldSeed], depth)
+        return dict(x=0, y=0, width=56, height=36, max_depth=6, seed=seed)
+    
+    def prefetch_floor(self, depth: int) -> None:
+        """Start generating the floor at depth in the background unless it's already cached."""
+        params = self.floor_params(depth)
+        if not g.floor_cache.contains(**params):
+            g.floor_pregen.request(**params)
+    
     def go_down_floor(self, exit_transfer_x: int, exit_transfer_y: int) -> None:
-        new_dungeon = game.world_tools.Dungeon(x=0, y=0, width=56, height=36, max_depth=6, seed=123444, exit_x=exit_transfer_x, exit_y=exit_transfer_y)
+        depth = len(self.dungeon_floors) + 1
+        params = self.floor_params(depth)
+        plan = g.floor_cache.load(**params)
+        if plan is None:
+            plan = g.floor_pregen.take(**params)
+            g.floor_cache.save(plan)
+        new_dungeon = game.world_tools.Dungeon(**params, exit_x=exit_transfer_x, exit_y=exit_transfer_y, plan=plan)
+        if depth in self.explored_floors:
+            new_dungeon.explored = game.world_tools.unpack_plane(self.explored_floors.pop(depth), new_dungeon.width, new_dungeon.height)
+        logger.info("Floor pregeneration hits: %d/%d", g.floor_pregen.hits, g.floor_pregen.hits + g.floor_pregen.misses)
         if len(self.dungeon_floors) == 0:
             g.log.add_item("You venture into the dungeon.")
         else:
             g.log.add_item("You venture further into the dungeon.")
         self.dungeon_floors.append(new_dungeon)
+        self.balance_floors()
         self.update_area_name(f"Floor {len(self.dungeon_floors)}")
+        self.prefetch_floor(len(self.dungeon_floors) + 1)
         
         # Enemy tick when entering dungeon
-        (player,) = g.world.Q.all_of(components=[], tags=[IsPlayer])
-        player_pos = player.components[Position]
-        for enemy in new_dungeon.world.Q.all_of(components=[Enemy]):
-            dir = enemy.components[Enemy].enemy_tick(player=player_pos, pos=enemy.components[Position], dungeon=new_dungeon)
-            enemy.components[Position] = Position(dir[0], dir[1])
+        player = Queries.of(g.world).player
+        self.enemy_turn(new_dungeon, player.components[Position])
+    
+    def enemy_turn(self, dungeon: game.world_tools.Dungeon, player_pos: Position) -> None:
+        """Let every awake actor due this turn act, then update enemy perception."""
+        def act(enemy: tcod.ecs.Entity) -> None:
+            pos = enemy.components[Position]
+            x, y = enemy.components[Enemy].enemy_tick(player=player_pos, pos=pos, dungeon=dungeon)
+            if x != pos.x or y != pos.y:
+                enemy.components[Position] = Position(x, y)
+        
+        dungeon.scheduler.run_turn(player_pos, act)
+        enemy_perception(dungeon.scheduler.awake(), player_pos, dungeon)
         
         
     def go_up_floor(self) -> None:
         g.log.add_item("You exit the dungeon floor.")
-        d = self.dungeon_floors.pop()
+        self.explored_floors[len(self.dungeon_floors)] = game.world_tools.pack_plane(self.dungeon_floors[-1].explored)
+        self.dungeon_floors.pop()
+        self.balance_floors()
         if len(self.dungeon_floors) > 0: self.update_area_name(f"Floor {len(self.dungeon_floors)}")
+        self.prefetch_floor(len(self.dungeon_floors) + 1)
         
+    def balance_floors(self) -> None:
+        """Freeze floors further than RESIDENT_FLOORS - 1 above the player and thaw the ones within it."""
+        for i, floor in enumerate(self.dungeon_floors):
+            resident = i >= len(self.dungeon_floors) - RESIDENT_FLOORS
+            if resident and isinstance(floor, game.world_tools.ColdFloor):
+                self.dungeon_floors[i] = floor.thaw()
+                logger.info("Thawed floor %d", i + 1)
+            elif not resident and isinstance(floor, game.world_tools.Dungeon):
+                self.dungeon_floors[i] = floor.freeze()
+                cold = self.dungeon_floors[i]
+                logger.info("Froze floor %d: grids %d to %d bytes, entities pickled into %d bytes", i + 1, floor.grid_bytes, cold.grid_bytes, cold.entity_bytes)
+    
+    def floor_memory(self) -> list[tuple[int, str, int, int | None]]:
+        """Returns the depth, "resident" or "cold", grid bytes and entity bytes of each floor on the stack.
+
+        Grid bytes count the same grids either way. Entity bytes are the pickled size of a cold floor's entities,
+        and None for resident floors, whose entities aren't measured."""
+        return [
+            (i + 1, "cold", floor.grid_bytes, floor.entity_bytes) if isinstance(floor, game.world_tools.ColdFloor) else (i + 1, "resident", floor.grid_bytes, None)
+            for i, floor in enumerate(self.dungeon_floors)
+        ]
+    
     # Handle event draw
     def on_draw(self, console: tcod.console.Console) -> None:
         """Draw the standard screen."""
         
         world = g.world if len(self.dungeon_floors) == 0 else self.dungeon_floors[-1].world
         
-        (player,) = g.world.Q.all_of(components=[], tags=[IsPlayer])
+        player = Queries.of(g.world).player
         player_pos = player.components[Position]
         offset_x = player_pos.x - 49
         offset_y = player_pos.y - 20
@@ -135,100 +242,63 @@ class InGame(State):
         # Draw GUI
         self.gui_draw(player_pos, console)
     
+    @timed("dungeon")
     def dungeon_draw(self, dungeon: game.world_tools.Dungeon, console: tcod.console.Console) -> None:
         offset_x = -22
         offset_y = -2
         rand = Random()
         
-        (player,) = g.world.Q.all_of(components=[], tags=[IsPlayer])
+        player = Queries.of(g.world).player
         player_pos = player.components[Position]
         
-        visible = tcod.map.compute_fov(transparency=dungeon.map.transparent, pov=(player_pos.x, player_pos.y), algorithm=2)
-        dungeon.explored |= visible.astype(np.uint32)
+        visible = dungeon.visible_from(player_pos.x, player_pos.y)
         
-        for x in range(dungeon.width):
-            for y in range(dungeon.height):    
-                dx = x-offset_x
-                dy = y-offset_y
-                if dx >= console.width or dy >= console.height or dx < 0 or dy < 0: continue
-                if not dungeon.map.transparent[max(0, x-1), y] and not dungeon.map.transparent[min(x+1, dungeon.width-1), y] and not dungeon.map.transparent[x, max(0, y-1)] and not dungeon.map.transparent[x, min(y+1, dungeon.height-1)]: continue
-                if not dungeon.explored[x, y]: continue
-                if dungeon.map.transparent[x, y]:
-                    col = (128) if visible[x, y] else (0)
-                    ch = ord(".")
-                else:
-                    col = (0, 255, 0) if visible[x, y] else (64)
-                    ch = ord("#")
-                    
-                console.rgb[["ch", "fg"]][dy, dx] = ch, col
+        # Clip dungeon to the console
+        left, top = max(0, offset_x), max(0, offset_y)
+        right = min(dungeon.width, console.width + offset_x)
+        bottom = min(dungeon.height, console.height + offset_y)
+        if left < right and top < bottom:
+            transparent = dungeon.map.transparent[left:right, top:bottom].T
+            seen = visible[left:right, top:bottom].T
+            shown = (dungeon.exposed[left:right, top:bottom] & (dungeon.explored[left:right, top:bottom] != 0)).T
+            
+            ch = np.where(transparent, ord("."), ord("#"))
+            fg = np.where(
+                transparent[..., np.newaxis],
+                np.where(seen[..., np.newaxis], 128, 0),
+                np.where(seen[..., np.newaxis], (0, 255, 0), 64)
+            )
+            
+            view = console.rgb[top-offset_y:bottom-offset_y, left-offset_x:right-offset_x]
+            view["ch"] = np.where(shown, ch, view["ch"])
+            view["fg"] = np.where(shown[..., np.newaxis], fg, view["fg"])
                 
-        # Draw entities
-        for entity in dungeon.world.Q.all_of(components=[Position, Graphic]):
-            if entity == player: continue
-            pos = entity.components[Position]
-            graphic = entity.components[Graphic]
-
-            if not visible[pos.x, pos.y]: continue
-            if not (GAMEFRAME_LEFT <= pos.x-offset_x < GAMEFRAME_RIGHT and GAMEFRAME_TOP <= pos.y-offset_y < GAMEFRAME_BOTTOM): continue   # Ignore offscreen
-            console.rgb[["ch", "fg", "bg"]][pos.y-offset_y, pos.x-offset_x] = graphic.ch, graphic.fg, (0,0,0)
+        # Draw visible entities, the player lives in g.world and is drawn by on_draw
+        RenderCache.of(dungeon.world).draw(console, offset_x, offset_y, (GAMEFRAME_LEFT, GAMEFRAME_TOP, GAMEFRAME_RIGHT, GAMEFRAME_BOTTOM), visible=visible)
                 
+    @timed("world")
     def overworld_draw(self, player_pos: Position, console: tcod.console.Console) -> None:
         lock_to_screen = True
         offset_x = player_pos.x - 49
         offset_y = player_pos.y - 20
         
         # Terrain
-        scale = 0.025
-        g.grid = g.noise[tcod.noise.grid(
-            shape=(100, 50), 
-            scale=scale, 
-            indexing="ij", 
-            origin=(offset_x*scale, offset_y*scale))
-        ]
-        
+        g.grid, ch, fg = g.terrain.sample(offset_x, offset_y, 100, 50)
+        g.terrain.prefetch(offset_x, offset_y, 100, 50)
+
         # Draw grass and terrain
-        chars = [".", ",", "'", "`"]
-        cols = [32, 16, 48, 64]
-        it = np.nditer(g.grid, flags=['multi_index'])
-        for pos in it:
-            ch = ord("^")
-            col = (0, 128, 0)
-            rand = int(g.noise.get_point(offset_y + it.multi_index[1], offset_x + it.multi_index[0])*4)
-            
-            if(pos < -0.25): 
-                ch = ord(chars[rand%4])
-                col = (0, cols[rand%4], 0)
-            elif(pos <= 0): 
-                col = (153, 141, 85)
-            # else:
-            #     col = (153, 141, 85)
-                
-            if(pos > NOISE_COLLISION_THRESH): ch = 0x2660
-            console.rgb[["ch", "fg"]][it.multi_index[1], it.multi_index[0]] = ch, col
+        console.rgb["ch"][:50, :100] = ch
+        console.rgb["fg"][:50, :100] = fg
                 
         # Draw level containers
-        for level_entity in g.world.Q.all_of(components=[LevelContainer]):
-            # TODO: Check if level is on screen
-            level = level_entity.components[LevelContainer]
-            tiles = np.nditer(level.tiles, flags=['multi_index'])
-            colors = level.colors
-            for tile in tiles:
-                if tile == 0: continue
-                ch = tcod.tileset.CHARMAP_CP437[int(tile)]    # CP437 to ASCII
-                col = game.constants.COLOR_PALLETE[colors[tiles.multi_index]]
-                tx = tiles.multi_index[0]
-                ty = tiles.multi_index[1]
-                if not (0 <= tx+level.x-offset_x < 100 and 0 <= ty+level.y-offset_y < 50): continue   # Ignore offscreen
-                console.rgb[["ch", "fg"]][ty+level.y-offset_y, tx+level.x-offset_x] = ch, col
+        g.world[None].components[game.world_tools.LevelStreamer].update(g.world, player_pos.x, player_pos.y)
+        for level_entity in g.world[None].components[game.world_tools.LevelIndex].overlapping(offset_x, offset_y, 100, 50):
+            level_entity.components[LevelContainer].draw(console, offset_x, offset_y, 100, 50)
                 
         # Draw entities
-        for entity in g.world.Q.all_of(components=[Position, Graphic]):
-            pos = entity.components[Position]
-            graphic = entity.components[Graphic]
-
-            if not (GAMEFRAME_LEFT <= pos.x-offset_x < GAMEFRAME_RIGHT and GAMEFRAME_TOP <= pos.y-offset_y < GAMEFRAME_BOTTOM): continue   # Ignore offscreen
-            console.rgb[["ch", "fg", "bg"]][pos.y-offset_y, pos.x-offset_x] = graphic.ch, graphic.fg, (0,0,0)
+        RenderCache.of(g.world).draw(console, offset_x, offset_y, (GAMEFRAME_LEFT, GAMEFRAME_TOP, GAMEFRAME_RIGHT, GAMEFRAME_BOTTOM))
 
+    @timed("gui")
     def gui_draw(self, player_pos: Position, console: tcod.console.Console) -> None:
         # Windows
         gameframe_decor = "╝═╚║ ║╗═╔"
@@ -248,25 +318,53 @@ class InGame(State):
                 
         # Player coords
         console.print(x=0, y=47, width=20, alignment=libtcodpy.CENTER, text=f"({player_pos.x}, {player_pos.y})", fg=(255, 255, 0))
+        
+        # Profiler overlay, slowest sections first
+        if profiler.enabled:
+            console.print(x=0, y=40, width=20, height=1, fg=(255, 255, 0), string="╣ Timings (ms) ╠", alignment=libtcodpy.CENTER)
+            console.print(x=1, y=41, width=18, height=1, fg=(255, 255, 0), string=f"{'':<5}{'p50':>6} {'p99':>6}")
+            stats = sorted(((name, *profiler.percentiles(name)) for name in profiler.samples), key=lambda stat: -stat[2])
+            for i, (name, p50, p99) in enumerate(stats[:5]):
+                console.print(x=1, y=42 + i, width=18, height=1, fg=(200, 200, 200), string=f"{name[:5]:<5}{p50:>6.2f} {p99:>6.2f}")
+            
+            # Cache stats in the inventory frame
+            console.print(x=80, y=0, width=20, height=1, fg=(255, 255, 0), string="╣ Debug ╠", alignment=libtcodpy.CENTER)
+            pregen_total = g.floor_pregen.hits + g.floor_pregen.misses
+            console.print(x=81, y=1, width=18, height=1, fg=(200, 200, 200), string=f"pregen {g.floor_pregen.hit_rate:>4.0%} {g.floor_pregen.hits}/{pregen_total}")
+            console.print(x=81, y=3, width=18, height=1, fg=(255, 255, 0), string=f"{'KiB':<7} {'grid':>5} {'ents':>4}")
+            for i, (depth, kind, grid, entities) in enumerate(self.floor_memory()[-40:]):
+                ents = "-" if entities is None else f"{entities / 1024:.1f}"
+                console.print(x=81, y=4 + i, width=18, height=1, fg=(200, 200, 200), string=f"{depth:>2} {kind[:4]:<4} {grid / 1024:>5.1f} {ents:>4}")
 
+    def hud_state(self) -> tuple:
+        """Everything drawn besides the map and entities, to tell whether an event that didn't move the player needs a redraw."""
+        return (g.current_actor, self.area_name, len(g.log.items), g.log.items[0] if g.log.items else None)
+    
     # Handle events        
+    @timed("event")
     def on_event(self, event: tcod.event.Event) -> StateResult:
         """Handle events for the in-game state."""
         world = g.world if len(self.dungeon_floors) == 0 else self.dungeon_floors[-1].world
-        (player,) = g.world.Q.all_of(components=[], tags=[IsPlayer])
+        player = Queries.of(g.world).player
         match event:
             # Movement
             case tcod.event.KeyDown(sym=sym) if sym in DIRECTION_KEYS:
                 player_pos = player.components[Position]
+                hud = self.hud_state()
+                
+                occupancy = Occupancy.of(world)
+                target = player_pos + DIRECTION_KEYS[sym]
                 
                 # Check for actor collision
-                for actor in world.Q.all_of(tags=[player_pos + DIRECTION_KEYS[sym]], components=[Actor]): 
+                for actor in occupancy.at(target.x, target.y):
+                    if Actor not in actor.components: continue
                     actor.components[Actor].on_interact()
                     return
                 g.current_actor = None
                 
                 # Check for transfers
-                for transferobj in world.Q.all_of(tags=[player_pos + DIRECTION_KEYS[sym]], components=[Transfer]): 
+                for transferobj in occupancy.at(target.x, target.y):
+                    if Transfer not in transferobj.components: continue
                     transfer = transferobj.components[Transfer]
                     if transfer.is_down:
                         self.go_down_floor(exit_transfer_x=player_pos.x, exit_transfer_y=player_pos.y)
@@ -284,35 +382,41 @@ class InGame(State):
                     
                     # LDtk levels
                     found_level = False
-                    for level in world.Q.all_of(components=[LevelContainer]):
-                        if not level.components[LevelContainer].within_bounds(player_pos.x, player_pos.y): continue
+                    world[None].components[game.world_tools.LevelStreamer].update(world, player_pos.x, player_pos.y)
+                    for level in world[None].components[game.world_tools.LevelIndex].at(player_pos.x, player_pos.y):
                         found_level = True
-                        self.update_area_name(level.components[LevelContainer].field_instances["name"])
-                        if level.components[LevelContainer].is_space_occupied(player_pos.x + DIRECTION_KEYS[sym][0], player_pos.y+DIRECTION_KEYS[sym][1]): return
+                        self.update_area_name(level.components[LevelStub].field_instances["name"])
+                        if level.components[LevelContainer].is_space_occupied(player_pos.x + DIRECTION_KEYS[sym][0], player_pos.y+DIRECTION_KEYS[sym][1]):
+                            return Unchanged() if self.hud_state() == hud else None
                         
                     if not found_level: self.update_area_name("Woods of Gloom")
                 
                 # Check for dungeon collision
                 else:
                     dungeon = self.dungeon_floors[-1]
-                    if not dungeon.map.walkable[player_pos.x + DIRECTION_KEYS[sym][0], player_pos.y + DIRECTION_KEYS[sym][1]]: return
+                    if not dungeon.map.walkable[player_pos.x + DIRECTION_KEYS[sym][0], player_pos.y + DIRECTION_KEYS[sym][1]]:
+                        return Unchanged() if self.hud_state() == hud else None
                     
                     # Enemy movement
-                    for enemy in world.Q.all_of(components=[Enemy]):
-                        dir = enemy.components[Enemy].enemy_tick(player=player_pos, pos=enemy.components[Position], dungeon=dungeon)
-                        enemy.components[Position] = Position(dir[0], dir[1])
+                    self.enemy_turn(dungeon, player_pos)
                 
                 
                 player.components[Position] += DIRECTION_KEYS[sym]
                 
                 # Pick up gold on the same space as the player
-                for gold in world.Q.all_of(components=[Gold], tags=[player.components[Position], IsItem]):
+                new_pos = player.components[Position]
+                for gold in [item for item in occupancy.at(new_pos.x, new_pos.y) if Gold in item.components and IsItem in item.tags]:
                     player.components[Gold] += gold.components[Gold]
                     text = f"Picked up {gold.components[Gold]}g, total: {player.components[Gold]}g"
                     g.log.add_item(f"Picked up {gold.components[Gold]}g, total: {player.components[Gold]}g")
                     gold.clear()
                 return None
             
+            # Toggle profiler overlay
+            case tcod.event.KeyDown(sym=KeySym.F3):
+                profiler.toggle()
+                return None
+            
             # Handle quit
             case tcod.event.KeyDown(sym=KeySym.ESCAPE):
                 #g.mixer.stop()
@@ -320,4 +424,4 @@ class InGame(State):
             case tcod.event.Quit:
                 raise SystemExit
             case _:
-                return None
\ No newline at end of file
+                return Unchanged()
\ No newline at end of file
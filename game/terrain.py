@@ -0,0 +1,234 @@
+"""Overworld terrain sampling and rendering tools."""
+from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Final
+import attrs
+import numpy as np
+import tcod.noise
+from game.constants import NOISE_COLLISION_THRESH
+from game.profiling import profiler
+
+TERRAIN_SCALE: Final = 0.025
+"""Scale of the terrain height field relative to world tiles."""
+
+GRASS_CHARS: Final = np.array([ord(c) for c in ".,'`"], dtype=np.int32)
+"""Grass glyphs indexed by detail variant."""
+
+GRASS_COLORS: Final = np.array([(0, 32, 0), (0, 16, 0), (0, 48, 0), (0, 64, 0)], dtype=np.uint8)
+"""Grass colors indexed by detail variant."""
+
+TREE_CH: Final = 0x2660
+DIRT_CH: Final = ord("^")
+DIRT_COLOR: Final = np.array((0, 128, 0), dtype=np.uint8)
+SAND_COLOR: Final = np.array((153, 141, 85), dtype=np.uint8)
+
+CHUNK_SIZE: Final = 32
+"""Width and height of a cached terrain chunk in tiles."""
+
+
+def sample_height(noise: tcod.noise.Noise, x: int, y: int, width: int, height: int) -> np.ndarray:
+    """Sample the terrain height field for a region, indexed [x, y].\n
+    Each tile is sampled at its own world coordinate so that regions sampled separately line up exactly."""
+    return noise[np.ix_(np.arange(x, x + width) * TERRAIN_SCALE, np.arange(y, y + height) * TERRAIN_SCALE)]
+
+def sample_detail(noise: tcod.noise.Noise, x: int, y: int, width: int, height: int) -> np.ndarray:
+    """Sample the unscaled glyph variation field for a region, indexed [y, x].\n
+    The noise axes are swapped relative to the height field, matching the original per-cell lookups."""
+    return noise[tcod.noise.grid(
+        shape=(height, width),
+        scale=1,
+        indexing="ij",
+        origin=(y, x))
+    ]
+
+def render_terrain(height: np.ndarray, detail: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Convert height [x, y] and detail [y, x] fields into console ordered ch and fg planes."""
+    height = height.T
+    variant = (detail * 4).astype(np.int32) % 4
+    grass = height < -0.25
+
+    ch = np.select([height > NOISE_COLLISION_THRESH, grass], [TREE_CH, GRASS_CHARS[variant]], DIRT_CH)
+    fg = np.where(grass[..., np.newaxis], GRASS_COLORS[variant], np.where((height <= 0)[..., np.newaxis], SAND_COLOR, DIRT_COLOR))
+    return ch, fg
+
+
+@attrs.define(frozen=True)
+class TerrainChunk:
+    """Sampled terrain fields for one chunk of the overworld."""
+    height: np.ndarray      # Indexed [x, y]
+    detail: np.ndarray      # Indexed [y, x]
+    ch: np.ndarray          # Baked glyphs, indexed [y, x]
+    fg: np.ndarray          # Baked colors, indexed [y, x]
+
+    @property
+    def nbytes(self) -> int:
+        return self.height.nbytes + self.detail.nbytes + self.ch.nbytes + self.fg.nbytes
+
+def sample_chunk(noise: tcod.noise.Noise, cx: int, cy: int) -> TerrainChunk:
+    """Sample and bake the terrain of the chunk at chunk coordinates (cx, cy)."""
+    x, y = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+    height = sample_height(noise, x, y, CHUNK_SIZE, CHUNK_SIZE)
+    detail = sample_detail(noise, x, y, CHUNK_SIZE, CHUNK_SIZE)
+    ch, fg = render_terrain(height, detail)
+    return TerrainChunk(height=height, detail=detail, ch=ch, fg=fg)
+
+# libtcod noise sampling isn't thread safe, so prefetching runs in worker processes each holding a copy of the sampler
+_worker_noise: tcod.noise.Noise | None = None
+
+def _init_worker(noise: tcod.noise.Noise) -> None:
+    global _worker_noise
+    _worker_noise = noise
+
+def _sample_chunk_worker(cx: int, cy: int) -> TerrainChunk:
+    return sample_chunk(_worker_noise, cx, cy)
+
+def chunk_range(x: int, y: int, width: int, height: int) -> tuple[range, range]:
+    """Return the chunk coordinate ranges covering a region."""
+    return (
+        range(x // CHUNK_SIZE, (x + width - 1) // CHUNK_SIZE + 1),
+        range(y // CHUNK_SIZE, (y + height - 1) // CHUNK_SIZE + 1),
+    )
+
+@attrs.define()
+class ChunkCache:
+    """Bounded LRU cache of terrain chunks keyed by chunk coordinates.\n
+    With workers > 0, chunks ahead of the player are baked in background processes by prefetch()."""
+    noise: tcod.noise.Noise
+    max_chunks: int = 256
+    max_bytes: int = 16 * 1024 * 1024
+    workers: int = 0
+    prefetch_radius: int = 2        # Chunks to bake beyond the viewport in the direction of travel
+    chunks: OrderedDict[tuple[int, int], TerrainChunk] = attrs.Factory(OrderedDict)
+    pending: dict[tuple[int, int], Future[TerrainChunk]] = attrs.Factory(dict)
+    executor: ProcessPoolExecutor | None = None
+    direction: tuple[int, int] = (0, 0)
+    last_pos: tuple[int, int] | None = None
+    nbytes: int = 0
+    hits: int = 0
+    misses: int = 0
+    prefetched: int = 0
+    cancelled: int = 0
+    failed: int = 0
+
+    def get(self, cx: int, cy: int) -> TerrainChunk:
+        """Return the chunk at (cx, cy), sampling it if it isn't cached or already prefetched.
+
+        Never waits on a prefetch: unfinished work for the chunk is cancelled or, if already running, left to be dropped."""
+        chunk = self.chunks.get((cx, cy))
+        if chunk is not None:
+            self.hits += 1
+            profiler.count("chunk hit")
+            self.chunks.move_to_end((cx, cy))
+            return chunk
+
+        self.misses += 1
+        profiler.count("chunk miss")
+        future = self.pending.pop((cx, cy), None)
+        if future is not None and future.done() and not future.cancelled() and future.exception() is None:
+            chunk = future.result()
+        else:
+            if future is not None and future.cancel(): self.cancelled += 1
+            chunk = sample_chunk(self.noise, cx, cy)
+        self.put(cx, cy, chunk)
+        return chunk
+
+    def put(self, cx: int, cy: int, chunk: TerrainChunk) -> None:
+        """Insert a chunk, evicting the least recently used chunks if over capacity."""
+        old = self.chunks.pop((cx, cy), None)
+        if old is not None:
+            self.nbytes -= old.nbytes
+        self.chunks[(cx, cy)] = chunk
+        self.nbytes += chunk.nbytes
+        while len(self.chunks) > 1 and (len(self.chunks) > self.max_chunks or self.nbytes > self.max_bytes):
+            _, evicted = self.chunks.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def clear(self) -> None:
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.chunks.clear()
+        self.nbytes = 0
+
+    def collect(self) -> None:
+        """Move finished background chunks into the cache.
+
+        Failed work is dropped and the chunk is sampled inline when next needed. A broken pool is shut down and restarted by the next prefetch."""
+        for key, future in list(self.pending.items()):
+            if not future.done(): continue
+            del self.pending[key]
+            if future.cancelled(): continue
+            error = future.exception()
+            if error is not None:
+                self.failed += 1
+                if isinstance(error, BrokenProcessPool):
+                    self.shutdown()
+                    return
+                continue
+            self.put(*key, future.result())
+            self.prefetched += 1
+
+    def prefetch(self, x: int, y: int, width: int, height: int) -> None:
+        """Queue background baking of chunks around the viewport, biased towards the direction of travel.\n
+        Queued work that is no longer wanted, such as after the player turns around, is cancelled."""
+        if self.workers <= 0: return
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.noise,))
+        self.collect()
+
+        if self.last_pos is not None:
+            move = (int(np.sign(x - self.last_pos[0])), int(np.sign(y - self.last_pos[1])))
+            if move != (0, 0): self.direction = move
+        self.last_pos = (x, y)
+
+        # Extend the region ahead of the player, keep a single chunk margin elsewhere
+        dx, dy = self.direction
+        ahead = self.prefetch_radius * CHUNK_SIZE
+        left = x - (ahead if dx < 0 else CHUNK_SIZE)
+        right = x + width + (ahead if dx > 0 else CHUNK_SIZE)
+        top = y - (ahead if dy < 0 else CHUNK_SIZE)
+        bottom = y + height + (ahead if dy > 0 else CHUNK_SIZE)
+        xs, ys = chunk_range(left, top, right - left, bottom - top)
+        wanted = {(cx, cy) for cx in xs for cy in ys}
+
+        # Cancel stale work
+        for key in [key for key in self.pending if key not in wanted]:
+            if self.pending.pop(key).cancel(): self.cancelled += 1
+
+        # Nearest chunks first
+        center_x = (x + width // 2) // CHUNK_SIZE
+        center_y = (y + height // 2) // CHUNK_SIZE
+        for key in sorted(wanted, key=lambda k: abs(k[0] - center_x) + abs(k[1] - center_y)):
+            if key in self.chunks or key in self.pending: continue
+            self.pending[key] = self.executor.submit(_sample_chunk_worker, *key)
+
+    def shutdown(self) -> None:
+        """Cancel pending work and stop the background processes."""
+        if self.executor is None: return
+        self.executor.shutdown(cancel_futures=True)
+        self.executor = None
+        self.pending.clear()
+
+    def sample(self, x: int, y: int, width: int, height: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Build the height [x, y] field and baked ch [y, x] and fg [y, x] planes of a region from cached chunks."""
+        self.collect()
+        heights = np.empty((width, height), dtype=np.float32)
+        ch = np.empty((height, width), dtype=np.int32)
+        fg = np.empty((height, width, 3), dtype=np.uint8)
+        xs, ys = chunk_range(x, y, width, height)
+        for cx in xs:
+            for cy in ys:
+                chunk = self.get(cx, cy)
+                # Overlap of the chunk and region in world space
+                left = max(x, cx * CHUNK_SIZE)
+                right = min(x + width, (cx + 1) * CHUNK_SIZE)
+                top = max(y, cy * CHUNK_SIZE)
+                bottom = min(y + height, (cy + 1) * CHUNK_SIZE)
+                cl, cr = left - cx * CHUNK_SIZE, right - cx * CHUNK_SIZE
+                ct, cb = top - cy * CHUNK_SIZE, bottom - cy * CHUNK_SIZE
+                heights[left - x:right - x, top - y:bottom - y] = chunk.height[cl:cr, ct:cb]
+                ch[top - y:bottom - y, left - x:right - x] = chunk.ch[ct:cb, cl:cr]
+                fg[top - y:bottom - y, left - x:right - x] = chunk.fg[ct:cb, cl:cr]
+        return heights, ch, fg
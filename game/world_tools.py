@@ -9,16 +9,56 @@ from game import g
 import attrs
 import tcod.noise
 import tcod.bsp
+import tcod.map
+from tcod import libtcodpy
 import numpy as np
 import os
 import json
+import hashlib
+import struct
+import time
+import logging
+import pickle
+import zlib
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Final
+from game.constants import WORLD_SEED, LEVEL_LOAD_RADIUS, LEVEL_UNLOAD_RADIUS, LEVEL_RELOAD_INTERVAL, COLD_FLOOR_COMPRESSION
+from game.pathing import GoalMap
+from game.scheduler import TurnScheduler
+from game.profiling import profiler, timed
+from game.occupancy import Occupancy
+from game.queries import Queries
 
-def new_world() -> Registry:
+logger = logging.getLogger(__name__)
+
+LEVEL_BUCKET_SIZE: Final = 64
+"""Width and height of a LevelIndex bucket in tiles."""
+
+FLOOR_CACHE_DIR: Final = "data/cache/floors"
+"""Directory of the on-disk generated floor cache."""
+
+OCCUPIED_COST: Final = 8
+"""Extra cost of pathing through a cell holding an actor when avoiding occupied cells."""
+
+FLOOR_CACHE_VERSION: Final = 1
+"""Bump when generation changes so stale cached floors are ignored."""
+
+LEVEL_DIR: Final = "data/ldtk/data"
+"""Directory of LDtk levels exported by data/ldtk/python/onSave.py."""
+
+LEVEL_MAGIC: Final = b"CLVL"
+LEVEL_VERSION: Final = 1
+LEVEL_PREFIX: Final = struct.Struct("<4sII")
+"""Magic, version and header length of a packed .lvl level, matching onSave.py."""
+
+def new_world(seed: int = WORLD_SEED) -> Registry:
     world = Registry()          # Entities are referenced with the syntax world[unique_id]
                                 # New objects are created with new_entity = world[object()] because object() is always unique
                                 # world[None] is used to define global entities
     
     rng = world[None].components[Random] = Random()
+    world[None].components[gc.WorldSeed] = seed
     
     # Define player
     player = world[object()]
@@ -26,6 +66,7 @@ def new_world() -> Registry:
     player.components[gc.Graphic] = gc.Graphic(ord("@"), fg=(255, 106, 0)) # 24 100 100
     player.components[gc.Gold] = 0
     player.tags |= {IsPlayer, IsActor}
+    Queries.of(world).player_entity = player
     
     # Actor test
     actor = world[object()]
@@ -45,12 +86,13 @@ def new_world() -> Registry:
     
     #dungeon_entrance.tags |= {}
     
-    # Import LDtk levels
-    for _, _, files in os.walk("data/ldtk/data", topdown=False):
-        for name in files:
-            level_data = json.loads(open(f"data/ldtk/data/{name}", 'r').read())
-            level = world[object()]
-            level.components[gc.LevelContainer] = gc.LevelContainer(level_data, world=world)
+    # Register LDtk levels, LevelStreamer loads them as the player comes near
+    level_index = world[None].components[LevelIndex] = LevelIndex()
+    world[None].components[LevelStreamer] = LevelStreamer()
+    for path in level_paths():
+        level = world[object()]
+        level.components[gc.LevelStub] = load_level_stub(path)
+        level_index.add(level)
     
     # Random gold placement
     # for _ in range(10):
@@ -62,9 +104,244 @@ def new_world() -> Registry:
     
     return world
 
+def level_paths(directory: str = LEVEL_DIR) -> list[str]:
+    """Paths of every exported level, preferring the packed .lvl over the .json of the same level."""
+    levels: dict[str, str] = {}
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        if ext == ".lvl" or ext == ".json" and stem not in levels:
+            levels[stem] = os.path.join(directory, name)
+    return list(levels.values())
+
+def load_level_data(path: str) -> dict:
+    """Read an exported level into the dict LevelContainer expects.\n
+    Packed .lvl levels are read with a single read. Their layers are flat uint8 views of that buffer in the same row major
+    order as the JSON int grids, with the tiles given as a dense "tile_grid" instead of a list.
+    The file isn't kept memory mapped, since the exporter and hot reloading replace level files while the game runs."""
+    if not path.endswith(".lvl"):
+        with open(path) as f:
+            data = json.load(f)
+        data["path"] = path
+        return data
+    
+    raw = np.fromfile(path, dtype=np.uint8)
+    if raw.size < LEVEL_PREFIX.size:
+        raise ValueError(f"{path} is truncated")
+    magic, version, header_size = LEVEL_PREFIX.unpack_from(raw)
+    if magic != LEVEL_MAGIC or version != LEVEL_VERSION:
+        raise ValueError(f"{path} is not a version {LEVEL_VERSION} packed level")
+    data = json.loads(raw[LEVEL_PREFIX.size:LEVEL_PREFIX.size + header_size].tobytes())
+    data["path"] = path
+    
+    cells = data["width"] * data["height"]
+    start = LEVEL_PREFIX.size + header_size
+    if raw.size < start + 3 * cells:
+        raise ValueError(f"{path} is truncated")
+    data["collision"], data["colors"], data["tile_grid"] = (raw[start + i * cells:start + (i + 1) * cells] for i in range(3))
+    return data
+
+def load_level_stub(path: str) -> gc.LevelStub:
+    """Read the bounds and fields of an exported level. Only the header of a packed .lvl level is read."""
+    if path.endswith(".lvl"):
+        with open(path, "rb") as f:
+            prefix = f.read(LEVEL_PREFIX.size)
+            if len(prefix) < LEVEL_PREFIX.size:
+                raise ValueError(f"{path} is truncated")     # Most likely still being written
+            magic, version, header_size = LEVEL_PREFIX.unpack(prefix)
+            if magic != LEVEL_MAGIC or version != LEVEL_VERSION:
+                raise ValueError(f"{path} is not a version {LEVEL_VERSION} packed level")
+            data = json.loads(f.read(header_size))
+            if os.fstat(f.fileno()).st_size < LEVEL_PREFIX.size + header_size + 3 * data["width"] * data["height"]:
+                raise ValueError(f"{path} is truncated")
+    else:
+        data = load_level_data(path)
+    return gc.LevelStub(
+        path=path,
+        id=data["id"],
+        x=data["x"],
+        y=data["y"],
+        width=data["width"],
+        height=data["height"],
+        field_instances={fi["id"]: fi["value"] for fi in data["field_instances"]},
+    )
+
+def floor_seed(world_seed: int, depth: int) -> int:
+    """Deterministic seed of the dungeon floor at depth for a world seed."""
+    return Random(f"{world_seed}:{depth}").getrandbits(32)
+
+@attrs.define()
+class LevelIndex:
+    """Uniform grid of buckets over level bounding rectangles.\n
+    Stored on the global entity of the overworld registry."""
+    bucket_size: int = LEVEL_BUCKET_SIZE
+    buckets: dict[tuple[int, int], list[tcod.ecs.Entity]] = attrs.Factory(dict)
+    order: dict[tcod.ecs.Entity, int] = attrs.Factory(dict)     # Insertion order, keeps results stable
+    next_order: int = 0
+    
+    def _bucket_keys(self, x: int, y: int, width: int, height: int) -> list[tuple[int, int]]:
+        """Buckets touched by the inclusive rectangle (x, y) to (x + width, y + height)."""
+        return [
+            (bx, by)
+            for bx in range(x // self.bucket_size, (x + width) // self.bucket_size + 1)
+            for by in range(y // self.bucket_size, (y + height) // self.bucket_size + 1)
+        ]
+    
+    def add(self, entity: tcod.ecs.Entity) -> None:
+        level = entity.components[gc.LevelStub]
+        self.order[entity] = self.next_order
+        self.next_order += 1
+        for key in self._bucket_keys(level.x, level.y, level.width, level.height):
+            self.buckets.setdefault(key, []).append(entity)
+    
+    def remove(self, entity: tcod.ecs.Entity) -> None:
+        if self.order.pop(entity, None) is None: return
+        level = entity.components[gc.LevelStub]
+        for key in self._bucket_keys(level.x, level.y, level.width, level.height):
+            bucket = self.buckets[key]
+            bucket.remove(entity)
+            if not bucket: del self.buckets[key]
+    
+    def at(self, x: int, y: int) -> list[tcod.ecs.Entity]:
+        """Returns the levels whose bounds contain (x, y)."""
+        bucket = self.buckets.get((x // self.bucket_size, y // self.bucket_size), [])
+        return [level for level in bucket if level.components[gc.LevelStub].within_bounds(x, y)]
+    
+    def overlapping(self, x: int, y: int, width: int, height: int) -> list[tcod.ecs.Entity]:
+        """Returns the levels overlapping the (x, y, width, height) rectangle."""
+        found = set()
+        for key in self._bucket_keys(x, y, width - 1, height - 1):
+            found.update(self.buckets.get(key, ()))
+        return sorted(
+            (entity for entity in found if entity.components[gc.LevelStub].overlaps(x, y, width, height)),
+            key=self.order.__getitem__
+        )
+    
+@attrs.define()
+class LevelStreamer:
+    """Loads levels near the player and unloads distant ones.\n
+    Stored on the global entity of the overworld registry. Entities of an unloaded level are saved on its LevelStub
+    and restored as they were on the next load, so changes such as taken items persist."""
+    load_radius: int = LEVEL_LOAD_RADIUS
+    unload_radius: int = LEVEL_UNLOAD_RADIUS
+    loaded: set[tcod.ecs.Entity] = attrs.Factory(set)
+    loads: int = 0
+    unloads: int = 0
+    
+    def update(self, world: Registry, x: int, y: int) -> None:
+        """Load levels within load_radius of (x, y) and unload those beyond unload_radius."""
+        for level in list(self.loaded):
+            if level.components[gc.LevelStub].distance(x, y) > self.unload_radius:
+                self.unload(level)
+        radius = self.load_radius
+        for level in world[None].components[LevelIndex].overlapping(x - radius, y - radius, radius * 2 + 1, radius * 2 + 1):
+            if level not in self.loaded and level.components[gc.LevelStub].distance(x, y) <= radius:
+                self.load(level)
+    
+    def load(self, level: tcod.ecs.Entity) -> None:
+        stub = level.components[gc.LevelStub]
+        container = gc.LevelContainer(load_level_data(stub.path), world=level.registry, spawn_entities=stub.saved_entities is None)
+        if stub.saved_entities is not None:
+            for components, tags in stub.saved_entities:
+                entity = level.registry[object()]
+                entity.components.update(components)
+                entity.tags |= tags
+                container.entities.append(entity)
+            stub.saved_entities = None
+        level.components[gc.LevelContainer] = container
+        self.loaded.add(level)
+        self.loads += 1
+    
+    def unload(self, level: tcod.ecs.Entity, save: bool = True) -> None:
+        """Remove a level's container and entities, saving the entities on its stub unless save is False."""
+        container = level.components.pop(gc.LevelContainer)
+        if save:
+            level.components[gc.LevelStub].saved_entities = [
+                (dict(entity.components.items()), set(entity.tags))
+                for entity in container.entities
+                if entity.components or entity.tags     # Skip entities that were cleared
+            ]
+        for entity in container.entities:
+            entity.clear()
+        self.loaded.discard(level)
+        self.unloads += 1
+    
+@attrs.define()
+class LevelWatcher:
+    """Polls the exported level files and reloads levels whose files changed into a running world.\n
+    Only changed levels are touched. Their entities are respawned from the new data, everything else is kept."""
+    directory: str = LEVEL_DIR
+    interval: float = LEVEL_RELOAD_INTERVAL
+    files: dict[str, tuple[str, int, int]] = attrs.Factory(dict)   # Path without extension to (path, mtime_ns, size)
+    next_poll: float = 0.0
+    reloads: int = 0
+    
+    def __attrs_post_init__(self) -> None:
+        self.files = self.scan()
+    
+    def scan(self) -> dict[str, tuple[str, int, int]]:
+        files = {}
+        for path in level_paths(self.directory):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:   # Removed since listing
+                continue
+            files[os.path.splitext(path)[0]] = (path, stat.st_mtime_ns, stat.st_size)
+        return files
+    
+    def update(self, world: Registry) -> bool:
+        """Reload changed levels if the poll interval passed. Returns True if any level was reloaded or removed."""
+        now = time.monotonic()
+        if now < self.next_poll: return False
+        self.next_poll = now + self.interval
+        
+        files = self.scan()
+        changed = {stem for stem, file in files.items() if self.files.get(stem) != file} | (self.files.keys() - files.keys())
+        self.files = files
+        if not changed: return False
+        
+        index = world[None].components[LevelIndex]
+        streamer = world[None].components[LevelStreamer]
+        levels = {os.path.splitext(level.components[gc.LevelStub].path)[0]: level for level in index.order}
+        updated = False
+        for stem in changed:
+            level = levels.get(stem)
+            stub = None
+            if stem in files:
+                try:
+                    stub = load_level_stub(files[stem][0])
+                except (OSError, ValueError, KeyError) as error:
+                    # Most likely still being exported. The old level is kept and finishing the write changes the file again
+                    logger.warning("Skipped reloading level %s: %s", stem, error)
+                    continue
+            if level is not None:
+                if level in streamer.loaded: streamer.unload(level, save=False)
+                index.remove(level)
+            if stub is None:
+                if level is not None:
+                    level.clear()
+                    updated = True
+                    logger.info("Removed level %s", stem)
+                continue
+            if level is None: level = world[object()]
+            level.components[gc.LevelStub] = stub
+            index.add(level)
+            self.reloads += 1
+            updated = True
+            logger.info("Reloaded level %s", stub.path)
+        return updated  # LevelStreamer loads reloaded levels near the player before the next draw
+    
+@attrs.define(frozen=True)
+class Spawn:
+    """Description of an entity to create when a floor is populated."""
+    kind: str       # "entrance", "exit" or "enemy"
+    x: int
+    y: int
+    name: str = ""
+
 @attrs.define(frozen=False)
-class Dungeon:
-    """Stores all data related to a dungeon."""
+class FloorPlan:
+    """Generated dungeon map and spawn description.\n
+    Holds no ECS state, so it can be generated in a worker process and pickled back."""
     x: int = 0
     y: int = 0
     max_depth: int = 3
@@ -75,14 +352,12 @@ class Dungeon:
     rooms: list[tcod.bsp.BSP] = attrs.field(init=False)
     door_room: tcod.bsp.BSP = attrs.field(init=False)
     map: tcod.map.Map = attrs.field(init=False)
-    explored: np.ndarray = attrs.field(init=False)
-    rng: Random = attrs.field(init=False)
-    bsp: tcod.bsp.BSP = attrs.field(init=False)
-    world: tcod.ecs.Registry = attrs.field(init=False)
-    entrance: object = attrs.field(init=False)
-    exit: object = attrs.field(init=False)
+    rng: tcod.random.Random | None = attrs.field(init=False)      # None for plans loaded from the cache
+    bsp: tcod.bsp.BSP | None = attrs.field(init=False)
+    player_spawn: tuple[int, int] = attrs.field(init=False)
+    spawns: list[Spawn] = attrs.field(init=False)
     
-    def __init__(self, x: int, y: int, width: int, height: int, seed: int = 12345, max_depth: int = 3, exit_x: int = 0, exit_y: int = 0):
+    def __init__(self, x: int, y: int, width: int, height: int, seed: int = 12345, max_depth: int = 3):
         super().__init__()
         
         self.x = x
@@ -90,13 +365,11 @@ class Dungeon:
         self.width = width
         self.height = height
         self.seed = seed
-        self.rng = tcod.random.Random(seed)
+        self.rng = tcod.random.Random(algorithm=tcod.random.MERSENNE_TWISTER, seed=seed)
         self.bsp = tcod.bsp.BSP(x=x, y=y, width=width, height=height)
-        self.map = np.zeros(shape=(width, height), dtype = np.uint32)
         self.map = tcod.map.Map(width=width, height=height, order='F')
-        self.explored = np.zeros(shape=(width, height), dtype=np.uint32, order='F')
         self.rooms = []
-        self.world = Registry()
+        self.spawns = []
         
         MIN_WIDTH = 5
         MIN_HEIGHT = 5
@@ -109,7 +382,8 @@ class Dungeon:
             min_width=MIN_WIDTH+1, 
             min_height=MIN_HEIGHT+1,
             max_horizontal_ratio=1.5, 
-            max_vertical_ratio=1.5
+            max_vertical_ratio=1.5,
+            seed=self.rng.random_c      # tcod<19 passes seed straight to C, requirements.txt pins it
         )
         
         # Generate rooms and corridors
@@ -133,10 +407,7 @@ class Dungeon:
                 node.height = maxy-miny + 1
                 
                 # Dig out room
-                for dx in range(minx, maxx + 1):
-                    for dy in range(miny, maxy + 1):
-                        self.map.transparent[dx, dy] = True
-                        self.map.walkable[dx, dy] = True
+                self.dig(minx, miny, maxx, maxy)
                                                 
                 self.rooms.append(node) #((minx + maxx) / 2, (miny + maxy) / 2))
                 
@@ -188,20 +459,22 @@ class Dungeon:
                         self.hline_left(right.x-1, y)
                         self.hline_right(right.x, y)
                         
-        # Remove any 1-char width walls        
-        for ry in range(self.height-1):
-            for rx in range(self.width-1):
-                if self.map.transparent[rx, ry]: continue
-                if self.map.transparent[rx-1, ry] and self.map.transparent[rx+1, ry]:
-                    self.map.transparent[rx, ry] = True
-                    self.map.walkable[rx, ry] = True
-                    
-        for rx in range(self.width-2):
-            for ry in range(self.height-2):            
-                if self.map.transparent[rx, ry]: continue
-                if self.map.transparent[rx, ry-1] and self.map.transparent[rx, ry+1]:
-                    self.map.transparent[rx, ry] = True
-                    self.map.walkable[rx, ry] = True
+        # Remove any 1-char width walls
+        # A wall is only removed when the next tile along the scan is already open, so removals never chain
+        # and each pass can be evaluated on the whole map at once. Index -1 wraps like the original scan did.
+        transparent = self.map.transparent
+        thin = ~transparent & np.roll(transparent, 1, axis=0) & np.roll(transparent, -1, axis=0)
+        thin[self.width-1:, :] = False
+        thin[:, self.height-1:] = False
+        self.map.transparent[thin] = True
+        self.map.walkable[thin] = True
+        
+        transparent = self.map.transparent
+        thin = ~transparent & np.roll(transparent, 1, axis=1) & np.roll(transparent, -1, axis=1)
+        thin[max(0, self.width-2):, :] = False
+        thin[:, max(0, self.height-2):] = False
+        self.map.transparent[thin] = True
+        self.map.walkable[thin] = True
                     
         # Restore border of dungeon
         self.map.transparent[0] = np.zeros(self.height, dtype=np.bool)
@@ -213,82 +486,403 @@ class Dungeon:
         self.map.transparent[:, self.height-1] = np.zeros(self.width, dtype=np.bool)
         self.map.walkable[:, self.height-1] = np.zeros(self.width, dtype=np.bool)
         
-        
-        # Move player
+        # Place player
         player_room = self.rooms[self.rng.randint(0, len(self.rooms)-1)]
-        (player,) = g.world.Q.all_of(components=[], tags=[IsPlayer])
-        player.components[gc.Position] = gc.Position(player_room.x + self.rng.randint(1, player_room.width-2), player_room.y + self.rng.randint(1, player_room.height-2))
+        self.player_spawn = (player_room.x + self.rng.randint(1, player_room.width-2), player_room.y + self.rng.randint(1, player_room.height-2))
         
         # Place entrance in same room as player
-        up_door = self.world[object()]
-        up_door.components[gc.Transfer] = gc.Transfer(exit_x, exit_y, False)
-        self.entrance = up_door
-        
-        up_door.components[gc.Position] = gc.Position(player_room.x + self.rng.randint(1, player_room.width-2), player_room.y + self.rng.randint(1, player_room.height-2))
-        while(player.components[gc.Position].x == up_door.components[gc.Position].x and player.components[gc.Position].y == up_door.components[gc.Position].y):
-            up_door.components[gc.Position] = gc.Position(player_room.x + self.rng.randint(1, player_room.width-2), player_room.y + self.rng.randint(1, player_room.height-2))
-        up_door.components[gc.Graphic] = gc.Graphic(ord("<"), fg=(255, 255, 255))
+        entrance = (player_room.x + self.rng.randint(1, player_room.width-2), player_room.y + self.rng.randint(1, player_room.height-2))
+        while entrance == self.player_spawn:
+            entrance = (player_room.x + self.rng.randint(1, player_room.width-2), player_room.y + self.rng.randint(1, player_room.height-2))
+        self.spawns.append(Spawn("entrance", *entrance))
         
         # Place exit
         self.door_room = self.rooms[self.rng.randint(0, len(self.rooms)-1)]
         while player_room == self.door_room:
             self.door_room = self.rooms[self.rng.randint(0, len(self.rooms)-1)]
-            
-        down_door = self.world[object()]
-        down_door.components[gc.Position] = gc.Position(self.door_room.x + self.rng.randint(1, self.door_room.width-2), self.door_room.y + self.rng.randint(1, self.door_room.height-2))
-        down_door.components[gc.Graphic] = gc.Graphic(ord(">"), fg=(255, 255, 255))
-        down_door.components[gc.Transfer] = gc.Transfer(0, 0, True)
-        self.exit = down_door
+        self.spawns.append(Spawn("exit", self.door_room.x + self.rng.randint(1, self.door_room.width-2), self.door_room.y + self.rng.randint(1, self.door_room.height-2)))
         
         # Place test enemy
-        enemy = self.world[object()]
         enemy_room = self.rooms[self.rng.randint(0, len(self.rooms)-1)]
-        enemy.components[gc.Position] = gc.Position(enemy_room.x + self.rng.randint(1, enemy_room.width-2), enemy_room.y + self.rng.randint(1, enemy_room.height-2))
-        enemy.components[gc.Graphic] = gc.Graphic(ord("F"), (255, 0, 0))
-        enemy.components[gc.Enemy] = gc.Enemy(name="Foul Beast", path=tcod.path.AStar(cost=self.map))
-        
-        
+        self.spawns.append(Spawn("enemy", enemy_room.x + self.rng.randint(1, enemy_room.width-2), enemy_room.y + self.rng.randint(1, enemy_room.height-2), name="Foul Beast"))
             
+    def save(self, path: str) -> None:
+        """Write the map and spawns to path as an uncompressed .npz archive."""
+        spawns = json.dumps([[spawn.kind, spawn.x, spawn.y, spawn.name] for spawn in self.spawns])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                params=np.array([self.x, self.y, self.width, self.height, self.seed, self.max_depth], dtype=np.int64),
+                transparent=self.map.transparent,
+                walkable=self.map.walkable,
+                rooms=np.array([(r.x, r.y, r.width, r.height) for r in self.rooms], dtype=np.int32).reshape(-1, 4),
+                door_room=np.array(self.rooms.index(self.door_room)),
+                player_spawn=np.array(self.player_spawn, dtype=np.int32),
+                spawns=np.array(spawns),
+            )
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str) -> FloorPlan:
+        """Read a plan written by save without running generation."""
+        with np.load(path) as data:
+            plan = cls.__new__(cls)
+            plan.x, plan.y, plan.width, plan.height, plan.seed, plan.max_depth = (int(v) for v in data["params"])
+            plan.map = tcod.map.Map(width=plan.width, height=plan.height, order='F')
+            plan.map.transparent[...] = data["transparent"]
+            plan.map.walkable[...] = data["walkable"]
+            plan.rooms = [tcod.bsp.BSP(x=int(x), y=int(y), width=int(w), height=int(h)) for x, y, w, h in data["rooms"]]
+            plan.door_room = plan.rooms[int(data["door_room"])]
+            plan.player_spawn = tuple(int(v) for v in data["player_spawn"])
+            plan.spawns = [Spawn(kind, x, y, name) for kind, x, y, name in json.loads(str(data["spawns"]))]
+            plan.rng = None
+            plan.bsp = None
+        return plan
+    
     # https://www.roguebasin.com/index.php?title=Complete_Roguelike_Tutorial,_using_Python%2Blibtcod,_extras#BSP_Dungeon_Generator
     
     
     
+    def dig(self, x1: int, y1: int, x2: int, y2: int) -> None:
+        """Open the inclusive rectangle from (x1, y1) to (x2, y2)."""
+        self.map.transparent[x1:x2+1, y1:y2+1] = True
+        self.map.walkable[x1:x2+1, y1:y2+1] = True
+    
     def vline(self, x, y1, y2):
         if y1 > y2:
             y1,y2 = y2,y1
-
-        for y in range(y1,y2+1):
-            self.map.transparent[x, y] = True
-            self.map.walkable[x, y] = True    
+        self.dig(x, y1, x, y2)
         
     def vline_up(self, x, y):
-        while y >= 0 and not self.map.transparent[x, y]:
-            self.map.transparent[x, y] = True
-            self.map.walkable[x, y] = True    
-            y -= 1
+        """Open tiles from (x, y) upwards until an open tile is reached."""
+        if y < 0: return
+        open_tiles = np.flatnonzero(self.map.transparent[x, :y+1])
+        self.dig(x, open_tiles[-1] + 1 if open_tiles.size else 0, x, y)
             
     def vline_down(self, x, y):
-        while y < self.height and not self.map.transparent[x, y]:
-            self.map.transparent[x, y] = True
-            self.map.walkable[x, y] = True    
-            y += 1
+        """Open tiles from (x, y) downwards until an open tile is reached."""
+        if y >= self.height: return
+        open_tiles = np.flatnonzero(self.map.transparent[x, y:])
+        self.dig(x, y, x, y + open_tiles[0] - 1 if open_tiles.size else self.height - 1)
             
     def hline(self, x1, y, x2):
         if x1 > x2:
             x1,x2 = x2,x1
-        for x in range(x1,x2+1):
-            self.map.transparent[x, y] = True
-            self.map.walkable[x, y] = True    
+        self.dig(x1, y, x2, y)
             
     def hline_left(self, x, y):
-        while x >= 0 and not self.map.transparent[x, y]:
-            self.map.transparent[x, y] = True
-            self.map.walkable[x, y] = True    
-            x -= 1
+        """Open tiles from (x, y) leftwards until an open tile is reached."""
+        if x < 0: return
+        open_tiles = np.flatnonzero(self.map.transparent[:x+1, y])
+        self.dig(open_tiles[-1] + 1 if open_tiles.size else 0, y, x, y)
             
     def hline_right(self, x, y):
-        while x < self.width and not self.map.transparent[x, y]:
-            self.map.transparent[x, y] = True
-            self.map.walkable[x, y] = True    
-            x += 1
-                
\ No newline at end of file
+        """Open tiles from (x, y) rightwards until an open tile is reached."""
+        if x >= self.width: return
+        open_tiles = np.flatnonzero(self.map.transparent[x:, y])
+        self.dig(x, y, x + open_tiles[0] - 1 if open_tiles.size else self.width - 1, y)
+
+
+@timed("floorgen")
+def generate_floor(**params) -> FloorPlan:
+    """Generate a floor plan on the calling thread, timed as the floorgen section."""
+    return FloorPlan(**params)
+
+
+@attrs.define(frozen=False)
+class Dungeon:
+    """Stores all data related to a dungeon."""
+    x: int = 0
+    y: int = 0
+    max_depth: int = 3
+    width: int = 100
+    height: int = 100
+    seed: int = 12345
+
+    rooms: list[tcod.bsp.BSP] = attrs.field(init=False)
+    door_room: tcod.bsp.BSP = attrs.field(init=False)
+    map: tcod.map.Map = attrs.field(init=False)
+    map_version: int = attrs.field(init=False)                      # Bump whenever map tiles change after generation
+    explored: np.ndarray = attrs.field(init=False)
+    fov: np.ndarray | None = attrs.field(init=False)
+    fov_key: tuple[int, int, int] | None = attrs.field(init=False)   # Point of view and map version fov was computed for
+    exposed: np.ndarray = attrs.field(init=False)
+    rng: Random = attrs.field(init=False)
+    bsp: tcod.bsp.BSP = attrs.field(init=False)
+    world: tcod.ecs.Registry = attrs.field(init=False)
+    entrance: object = attrs.field(init=False)
+    exit: object = attrs.field(init=False)
+    goal_maps: dict[str, GoalMap] = attrs.field(init=False)
+    goal_map_versions: dict[str, int] = attrs.field(init=False)    # Occupancy version of goal maps avoiding occupied cells
+    scheduler: TurnScheduler = attrs.field(init=False)
+    
+    def __init__(self, x: int, y: int, width: int, height: int, seed: int = 12345, max_depth: int = 3, exit_x: int = 0, exit_y: int = 0, plan: FloorPlan | None = None):
+        """Create a dungeon floor from plan, generating it first if no plan is given.\n
+        exit_x and exit_y are where the entrance leads back to."""
+        if plan is None:
+            plan = generate_floor(x=x, y=y, width=width, height=height, seed=seed, max_depth=max_depth)
+        
+        self.x = plan.x
+        self.y = plan.y
+        self.width = plan.width
+        self.height = plan.height
+        self.seed = plan.seed
+        self.max_depth = plan.max_depth
+        self.rng = plan.rng
+        self.bsp = plan.bsp
+        self.map = plan.map
+        self.map_version = 0
+        self.rooms = plan.rooms
+        self.door_room = plan.door_room
+        self.explored = np.zeros(shape=(self.width, self.height), dtype=bool, order='F')
+        self.fov = None
+        self.fov_key = None
+        self.exposed = self.compute_exposed()
+        self.goal_maps = {}
+        self.goal_map_versions = {}
+        self.populate(plan, exit_x, exit_y)
+    
+    def populate(self, plan: FloorPlan, exit_x: int, exit_y: int) -> None:
+        """Create this floor's registry from the plan's spawns and move the player to its spawn point."""
+        self.world = Registry()
+        self.scheduler = TurnScheduler()
+        
+        player = Queries.of(g.world).player
+        player.components[gc.Position] = gc.Position(*plan.player_spawn)
+        
+        for spawn in plan.spawns:
+            entity = self.world[object()]
+            entity.components[gc.Position] = gc.Position(spawn.x, spawn.y)
+            match spawn.kind:
+                case "entrance":
+                    entity.components[gc.Transfer] = gc.Transfer(exit_x, exit_y, False)
+                    entity.components[gc.Graphic] = gc.Graphic(ord("<"), fg=(255, 255, 255))
+                    self.entrance = entity
+                case "exit":
+                    entity.components[gc.Graphic] = gc.Graphic(ord(">"), fg=(255, 255, 255))
+                    entity.components[gc.Transfer] = gc.Transfer(0, 0, True)
+                    self.exit = entity
+                case "enemy":
+                    entity.components[gc.Graphic] = gc.Graphic(ord("F"), (255, 0, 0))
+                    entity.components[gc.Enemy] = gc.Enemy(name=spawn.name)
+                    self.scheduler.add(entity)
+    
+    def compute_exposed(self) -> np.ndarray:
+        """Returns a mask of tiles with at least one transparent neighbour, clamped at the map edges.\n
+        Tiles outside of this mask are never drawn."""
+        padded = np.pad(self.map.transparent, 1, mode="edge")
+        return padded[:-2, 1:-1] | padded[2:, 1:-1] | padded[1:-1, :-2] | padded[1:-1, 2:]
+    
+    def visible_from(self, x: int, y: int) -> np.ndarray:
+        """Returns the symmetric field of view from (x, y), indexed [x, y].
+
+        Recomputed only when the point of view or map changes, and newly seen tiles are added to explored then,
+        so perception and drawing in the same turn share one FOV. The result is shared and must not be modified."""
+        key = (x, y, self.map_version)
+        if self.fov_key != key:
+            self.fov = tcod.map.compute_fov(transparency=self.map.transparent, pov=(x, y), algorithm=libtcodpy.FOV_SYMMETRIC_SHADOWCAST)
+            self.fov_key = key
+            self.explored |= self.fov
+        return self.fov
+    
+    @property
+    def occupancy(self) -> Occupancy:
+        return Occupancy.of(self.world)
+    
+    def cost_map(self, avoid_occupied: bool = False) -> np.ndarray:
+        """Movement costs for goal maps, 0 where blocked.\n
+        With avoid_occupied, cells holding actors cost OCCUPIED_COST more so paths go around crowds."""
+        cost = self.map.walkable.astype(np.int32)
+        if avoid_occupied:
+            cost[self.occupancy.blocked_area(0, 0, self.width, self.height) & (cost != 0)] += OCCUPIED_COST
+        return cost
+    
+    def goal_map(self, name: str, goals: tuple[tuple[int, int], ...], avoid_occupied: bool = False) -> GoalMap:
+        """Returns the shared goal map called name, rebuilding it only when its goals have changed.\n
+        e.g. goal_map("player", ((player.x, player.y),)) or goal_map("stairs", ((exit.x, exit.y),))
+        Maps with avoid_occupied are also rebuilt whenever an actor moves, so they suit few callers per turn."""
+        key = f"occupied:{name}" if avoid_occupied else name
+        goal_map = self.goal_maps.get(key)
+        if goal_map is None or goal_map.goals != goals or avoid_occupied and self.goal_map_versions.get(key) != self.occupancy.version:
+            goal_map = self.goal_maps[key] = GoalMap.towards(self.cost_map(avoid_occupied), goals)
+            if avoid_occupied: self.goal_map_versions[key] = self.occupancy.version
+        return goal_map
+    
+    def flee_map(self, name: str, goals: tuple[tuple[int, int], ...]) -> GoalMap:
+        """Returns a shared map leading away from goals, built from the goal map called name."""
+        source = self.goal_map(name, goals)
+        key = f"flee:{name}"
+        flee = self.goal_maps.get(key)
+        if flee is None or flee.goals != goals:
+            flee = self.goal_maps[key] = GoalMap.away_from(self.map.walkable.astype(np.int32), source)
+        return flee
+    
+    @property
+    def grid_bytes(self) -> int:
+        """Memory held by this floor's grids: the map, explored and exposed masks, FOV and goal maps.
+
+        Entities aren't counted, their in-memory size isn't measurable cheaply. ColdFloor.grid_bytes counts the same grids."""
+        arrays = [self.map.walkable, self.map.transparent, self.map.fov, self.explored, self.exposed]
+        if self.fov is not None: arrays.append(self.fov)
+        for goal_map in self.goal_maps.values():
+            arrays += [goal_map.distance, goal_map.step_x, goal_map.step_y]
+        return sum(array.nbytes for array in arrays)
+    
+    def freeze(self) -> ColdFloor:
+        """Returns a compact copy of this floor to keep while it's far from the player.
+
+        Map and explored planes are bit-packed. Everything else is pickled together, so entity references between
+        the registry, scheduler and stairs survive, and compressed unless COLD_FLOOR_COMPRESSION is 0.
+        Derived arrays such as goal maps and the FOV are dropped and rebuilt on demand after thawing."""
+        state = {field.name: getattr(self, field.name) for field in attrs.fields(Dungeon) if field.name not in COLD_DERIVED}
+        entities = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        if COLD_FLOOR_COMPRESSION:
+            entities = zlib.compress(entities, COLD_FLOOR_COMPRESSION)
+        return ColdFloor(
+            width=self.width,
+            height=self.height,
+            walkable=pack_plane(self.map.walkable),
+            transparent=pack_plane(self.map.transparent),
+            explored=pack_plane(self.explored),
+            entities=entities,
+            compressed=bool(COLD_FLOOR_COMPRESSION),
+        )
+
+
+COLD_DERIVED: Final = frozenset({"map", "explored", "exposed", "fov", "fov_key", "goal_maps", "goal_map_versions"})
+"""Dungeon fields stored as packed planes or rebuilt when a cold floor is thawed, rather than pickled."""
+
+def pack_plane(plane: np.ndarray) -> np.ndarray:
+    """Bit-pack a boolean [x, y] plane, 8 tiles per byte."""
+    return np.packbits(plane, axis=None)
+
+def unpack_plane(packed: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Inverse of pack_plane, returning a Fortran ordered bool plane."""
+    return np.asfortranarray(np.unpackbits(packed, count=width * height).reshape(width, height).astype(bool))
+
+@attrs.define(frozen=True)
+class ColdFloor:
+    """Compact form of a Dungeon the player isn't near, made by Dungeon.freeze."""
+    width: int
+    height: int
+    walkable: np.ndarray        # pack_plane of the map
+    transparent: np.ndarray
+    explored: np.ndarray
+    entities: bytes             # Pickled remaining Dungeon fields, including the floor's registry
+    compressed: bool
+    
+    @property
+    def grid_bytes(self) -> int:
+        """Size of the packed map and explored planes. The other grids are rebuilt on thawing and take nothing."""
+        return self.walkable.nbytes + self.transparent.nbytes + self.explored.nbytes
+    
+    @property
+    def entity_bytes(self) -> int:
+        """Size of the pickled, possibly compressed, registry and remaining fields."""
+        return len(self.entities)
+    
+    def thaw(self) -> Dungeon:
+        """Returns the Dungeon this floor was frozen from."""
+        state = pickle.loads(zlib.decompress(self.entities) if self.compressed else self.entities)
+        dungeon = Dungeon.__new__(Dungeon)
+        for name, value in state.items():
+            setattr(dungeon, name, value)
+        dungeon.map = tcod.map.Map(width=self.width, height=self.height, order='F')
+        dungeon.map.walkable[...] = unpack_plane(self.walkable, self.width, self.height)
+        dungeon.map.transparent[...] = unpack_plane(self.transparent, self.width, self.height)
+        dungeon.explored = unpack_plane(self.explored, self.width, self.height)
+        dungeon.exposed = dungeon.compute_exposed()
+        dungeon.fov = None
+        dungeon.fov_key = None
+        dungeon.goal_maps = {}
+        dungeon.goal_map_versions = {}
+        return dungeon
+
+
+@attrs.define()
+class FloorCache:
+    """Content-addressed on-disk cache of generated floor plans.\n
+    Plans are keyed by a hash of their generation parameters, so the same world seed always reuses the same files."""
+    directory: str = FLOOR_CACHE_DIR
+    hits: int = 0
+    misses: int = 0
+    
+    def path(self, x: int, y: int, width: int, height: int, seed: int, max_depth: int) -> str:
+        key = json.dumps([FLOOR_CACHE_VERSION, x, y, width, height, seed, max_depth])
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".npz")
+    
+    def contains(self, **params) -> bool:
+        return os.path.exists(self.path(**params))
+    
+    def load(self, **params) -> FloorPlan | None:
+        """Return the cached plan for params, or None if it hasn't been generated yet.
+
+        Unreadable entries, such as one truncated by a crash, are deleted and treated as missing."""
+        path = self.path(**params)
+        try:
+            plan = FloorPlan.load(path)
+        except FileNotFoundError:
+            self.misses += 1
+            profiler.count("floor cache miss")
+            return None
+        except (OSError, EOFError, ValueError, KeyError, IndexError, zipfile.BadZipFile) as error:
+            logger.warning("Discarding unreadable cached floor %s: %s", path, error)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.misses += 1
+            profiler.count("floor cache miss")
+            return None
+        self.hits += 1
+        profiler.count("floor cache hit")
+        return plan
+    
+    def save(self, plan: FloorPlan) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        plan.save(self.path(x=plan.x, y=plan.y, width=plan.width, height=plan.height, seed=plan.seed, max_depth=plan.max_depth))
+    
+
+@attrs.define()
+class FloorPregenerator:
+    """Speculatively generates dungeon floors in a background process.\n
+    Plans are keyed by their generation parameters, so a request only hits if the floor asked for matches.
+    With workers=0 requests are ignored and every floor is generated on demand."""
+    workers: int = 1
+    executor: ProcessPoolExecutor | None = None
+    pending: dict[tuple, Future[FloorPlan]] = attrs.Factory(dict)
+    hits: int = 0
+    misses: int = 0
+    
+    def request(self, **params) -> None:
+        """Start generating a floor in the background."""
+        key = tuple(sorted(params.items()))
+        if self.workers <= 0 or key in self.pending: return
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.pending[key] = self.executor.submit(FloorPlan, **params)
+    
+    def take(self, **params) -> FloorPlan:
+        """Return the pregenerated floor for params if it's ready, generating it synchronously otherwise."""
+        future = self.pending.pop(tuple(sorted(params.items())), None)
+        if future is not None and future.done() and not future.cancelled() and future.exception() is None:
+            self.hits += 1
+            profiler.count("pregen hit")
+            return future.result()
+        if future is not None: future.cancel()
+        self.misses += 1
+        profiler.count("pregen miss")
+        return generate_floor(**params)
+    
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+    
+    def shutdown(self) -> None:
+        """Cancel pending work and stop the background process."""
+        if self.executor is None: return
+        self.executor.shutdown(cancel_futures=True)
+        self.executor = None
+        self.pending.clear()
@@ -0,0 +1,112 @@
+"""Headless simulation entry point. Drives the game with scripted or random input against an offscreen console
+and reports game-logic throughput, without opening a window.\n
+Example: python headless.py --steps 2000 --seed 1
+Scripts hold one KeySym name per line, as written by main.py --record."""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from collections.abc import Iterator
+
+import numpy as np
+import tcod.event
+from tcod.event import KeySym
+
+import game.g as g
+import game.state_tools
+from game.profiling import profiler
+from game.queries import Queries
+import main
+
+
+def scripted_events(path: str) -> Iterator[tcod.event.KeyDown]:
+    """Yield key presses from a file of KeySym names. Blank lines and lines starting with # are skipped."""
+    with open(path) as file:
+        for line in file:
+            name = line.strip()
+            if not name or name.startswith("#"): continue
+            yield key_event(KeySym[name])
+
+def random_walk(steps: int, seed: int) -> Iterator[tcod.event.KeyDown]:
+    """Yield steps seeded random movement key presses."""
+    rng = random.Random(seed)
+    keys = [KeySym.LEFT, KeySym.RIGHT, KeySym.UP, KeySym.DOWN, KeySym.HOME, KeySym.END, KeySym.PAGEUP, KeySym.PAGEDOWN]
+    for _ in range(steps):
+        yield key_event(rng.choice(keys))
+
+def key_event(sym: KeySym) -> tcod.event.KeyDown:
+    return tcod.event.KeyDown(scancode=0, sym=sym, mod=tcod.event.Modifier.NONE)
+
+def floor_depth() -> int:
+    return len(getattr(g.states[0], "dungeon_floors", ())) if g.states else 0
+
+def simulate(events: Iterator[tcod.event.Event]) -> dict[str, list[float]]:
+    """Run events through the active state, drawing after each one that changed the display.\n
+    Returns the wall time in seconds of every turn, every draw, and every turn that generated a new floor."""
+    timings: dict[str, list[float]] = {"turn": [], "draw": [], "floor": []}
+    game.state_tools.render(g.console)
+    for event in events:
+        if not g.states: break
+        depth = floor_depth()
+        start = time.perf_counter()
+        try:
+            dirty = game.state_tools.apply_state_result(g.states[-1].on_event(event))
+        except SystemExit:
+            break
+        elapsed = time.perf_counter() - start
+        timings["turn"].append(elapsed)
+        if floor_depth() > depth: timings["floor"].append(elapsed)
+        if not g.states: break
+        if not dirty: continue
+
+        start = time.perf_counter()
+        game.state_tools.render(g.console)
+        timings["draw"].append(time.perf_counter() - start)
+    return timings
+
+def summarize(name: str, samples: list[float]) -> str:
+    if not samples: return f"{name:>6}: no samples"
+    ms = np.array(samples) * 1000
+    return f"{name:>6}: n={len(ms)} mean={ms.mean():.3f}ms p50={np.percentile(ms, 50):.3f}ms p99={np.percentile(ms, 99):.3f}ms max={ms.max():.3f}ms"
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--script", metavar="PATH", help="file of KeySym names to replay instead of a random walk")
+    parser.add_argument("--steps", type=int, default=1000, help="number of random walk steps")
+    parser.add_argument("--seed", type=int, default=0, help="random walk seed")
+    parser.add_argument("--trace", metavar="PATH", help="profile sections and write their timings to a .csv or .json file")
+    parser.add_argument("--no-background", action="store_true", help="disable terrain prefetching and floor pregeneration")
+    args = parser.parse_args()
+
+    main.init_globals(background=not args.no_background)
+    profiler.enabled = args.trace is not None
+    try:
+        events = scripted_events(args.script) if args.script else random_walk(args.steps, args.seed)
+        start = time.perf_counter()
+        timings = simulate(events)
+        total = time.perf_counter() - start
+    finally:
+        main.shutdown_globals()
+
+    turns = len(timings["turn"])
+    print(f"{turns} turns in {total:.3f}s, {turns / total if total else 0:.1f} turns/s (including draws)")
+    print(f"{sum(timings['turn']) and turns / sum(timings['turn']):.1f} turns/s (logic only)")
+    for name in ("turn", "draw", "floor"):
+        print(summarize(name, timings[name]))
+    for name in profiler.samples:
+        p50, p99 = profiler.percentiles(name)
+        print(f"{name:>8}: calls={profiler.counters[name]} p50={p50:.3f}ms p99={p99:.3f}ms (last {len(profiler.samples[name])})")
+    for name, count in profiler.counters.items():
+        if name not in profiler.samples: print(f"{name:>16}: {count}")
+    if args.trace: profiler.export(args.trace)
+    print(f"terrain chunks: {g.terrain.hits} hits, {g.terrain.misses} misses, {g.terrain.prefetched} prefetched")
+    print(f"floors: pregen hit rate {g.floor_pregen.hit_rate:.0%}, cache {g.floor_cache.hits} hits, {g.floor_cache.misses} misses")
+    for depth, kind, grid, entities in getattr(g.states[0], "floor_memory", list)():
+        print(f"floor {depth}: {kind}, grids {grid} bytes" + ("" if entities is None else f", entities pickled into {entities} bytes"))
+    queries = Queries.of(g.world)
+    print(f"player handle: {queries.hits} served directly, {queries.rebuilds} queried again")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,6 +1,7 @@
 """Main entry-point module. This script is used to start the program."""
 from __future__ import annotations
 
+import argparse
 import attrs
 import tcod.tileset
 import tcod.event
@@ -8,20 +9,20 @@ import tcod.console
 import tcod.context
 import tcod.noise
 
+import game.constants
+import game.profiling
+import game.save
 import game.g as g
 import game.state_tools
 import game.states
+import game.terrain
 import game.world_tools
 
 
-def main() -> None:
-    tileset = tcod.tileset.load_tilesheet(
-        "data/spr/alloycurses.png", columns=16, rows=16, charmap=tcod.tileset.CHARMAP_CP437
-    )
-    
-    tcod.tileset.procedural_block_elements(tileset=tileset)
+def init_globals(background: bool = True) -> None:
+    """Set up the global game state shared by every entry point.\n
+    background=False disables terrain prefetching and floor pregeneration."""
     g.console = tcod.console.Console(100, 50)
-    g.states = [game.states.InGame()]
     g.noise = tcod.noise.Noise(
         dimensions=2,
         algorithm=tcod.noise.Algorithm.SIMPLEX,
@@ -29,14 +30,51 @@ def main() -> None:
         #lacunarity=
         hurst=0.5,
         octaves=4,
-        seed=10491049
+        seed=game.constants.WORLD_SEED
+    )
+    g.terrain = game.terrain.ChunkCache(
+        g.noise,
+        workers=game.constants.TERRAIN_PREFETCH_WORKERS if background else 0,
+        prefetch_radius=game.constants.TERRAIN_PREFETCH_RADIUS
+    )
+    g.floor_pregen = game.world_tools.FloorPregenerator(workers=1 if background else 0)
+    g.floor_cache = game.world_tools.FloorCache()
+    g.save_writer = game.save.SaveWriter()
+    g.states = [game.states.InGame()]
+
+def shutdown_globals() -> None:
+    """Stop background workers started by init_globals."""
+    g.terrain.shutdown()
+    g.floor_pregen.shutdown()
+    g.save_writer.shutdown()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--record", metavar="PATH", help="record key presses to PATH for headless.py --script")
+    parser.add_argument("--hot-reload", action="store_true", help="reload levels when their exported files change")
+    parser.add_argument("--trace", metavar="PATH", help="profile from startup and write section timings to a .csv or .json file on exit")
+    args = parser.parse_args()
+    
+    tileset = tcod.tileset.load_tilesheet(
+        "data/spr/alloycurses.png", columns=16, rows=16, charmap=tcod.tileset.CHARMAP_CP437
     )
     
+    tcod.tileset.procedural_block_elements(tileset=tileset)
+    init_globals()
+    record = open(args.record, "w") if args.record else None
+    game.profiling.profiler.enabled = args.trace is not None
+    if args.hot_reload: g.level_watcher = game.world_tools.LevelWatcher()
+    
     # Game loop
     with tcod.context.new(tileset=tileset, console=g.console) as g.context:
         #window = g.context.sdl_window
         #window.fullscreen = tcod.sdl.video.WindowFlags.FULLSCREEN_DESKTOP
-        game.state_tools.main_loop()
+        try:
+            game.state_tools.main_loop(record=record)
+        finally:
+            shutdown_globals()
+            if record is not None: record.close()
+            if args.trace: game.profiling.profiler.export(args.trace)
     
             
 
@@ -0,0 +1,38 @@
+"""Overworld terrain must render exactly as the original per-tile loop did."""
+from __future__ import annotations
+from concurrent.futures import Future
+from pathlib import Path
+import numpy as np
+import tcod.noise
+import game.terrain
+
+BASELINE = Path(__file__).parent / "data" / "terrain_baseline.npz"
+"""ch and fg planes of 100x50 viewports at several offsets, rendered by the nditer loop in InGame.overworld_draw
+before terrain rendering was vectorized, with the noise sampler from main.py."""
+
+def make_noise() -> tcod.noise.Noise:
+    return tcod.noise.Noise(
+        dimensions=2,
+        algorithm=tcod.noise.Algorithm.SIMPLEX,
+        implementation=tcod.noise.Implementation.FBM,
+        hurst=0.5,
+        octaves=4,
+        seed=10491049,
+    )
+
+def test_terrain_matches_baseline() -> None:
+    baseline = np.load(BASELINE)
+    cache = game.terrain.ChunkCache(make_noise())
+    for (x, y), ch, fg in zip(baseline["offsets"], baseline["ch"], baseline["fg"]):
+        _, got_ch, got_fg = cache.sample(int(x), int(y), 100, 50)
+        np.testing.assert_array_equal(got_ch, ch, err_msg=f"glyphs at offset {x}, {y}")
+        np.testing.assert_array_equal(got_fg, fg, err_msg=f"colors at offset {x}, {y}")
+
+def test_failed_prefetch_is_sampled_inline() -> None:
+    cache = game.terrain.ChunkCache(make_noise())
+    future: Future[game.terrain.TerrainChunk] = Future()
+    future.set_exception(RuntimeError("worker failed"))
+    cache.pending[(0, 0)] = future
+    cache.collect()
+    assert cache.failed == 1 and not cache.pending
+    assert cache.get(0, 0) is not None
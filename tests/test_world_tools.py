@@ -0,0 +1,37 @@
+"""Dungeon generation must produce the same floors as the original per-tile generator."""
+from __future__ import annotations
+from pathlib import Path
+import os
+import numpy as np
+from game.world_tools import FloorCache, FloorPlan, unpack_plane
+
+BASELINE = Path(__file__).parent / "data" / "dungeons_baseline.npz"
+"""Floors generated by Dungeon.__init__ before it used whole-array operations, seeded the way FloorPlan seeds them.\n
+cases holds (width, height, max_depth, seed) rows, walkable and transparent the concatenated pack_plane of each map,
+and spawns the player, entrance, exit and enemy positions of each floor."""
+
+def test_floors_match_baseline() -> None:
+    baseline = np.load(BASELINE)
+    position = 0
+    for (width, height, max_depth, seed), spawns in zip(baseline["cases"], baseline["spawns"]):
+        width, height = int(width), int(height)
+        size = (width * height + 7) // 8
+        walkable = unpack_plane(baseline["walkable"][position:position + size], width, height)
+        transparent = unpack_plane(baseline["transparent"][position:position + size], width, height)
+        position += size
+        
+        plan = FloorPlan(x=0, y=0, width=width, height=height, seed=int(seed), max_depth=int(max_depth))
+        np.testing.assert_array_equal(plan.map.walkable, walkable, err_msg=f"walkable of seed {seed}")
+        np.testing.assert_array_equal(plan.map.transparent, transparent, err_msg=f"transparent of seed {seed}")
+        placed = {spawn.kind: (spawn.x, spawn.y) for spawn in plan.spawns}
+        assert (*plan.player_spawn, *placed["entrance"], *placed["exit"], *placed["enemy"]) == tuple(spawns), f"spawns of seed {seed}"
+
+def test_corrupt_cached_floor_is_discarded(tmp_path: Path) -> None:
+    cache = FloorCache(directory=str(tmp_path))
+    params = dict(x=0, y=0, width=56, height=36, seed=7, max_depth=3)
+    cache.save(FloorPlan(**params))
+    path = cache.path(**params)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) // 2)
+    assert cache.load(**params) is None
+    assert not os.path.exists(path) and cache.misses == 1